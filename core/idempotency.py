@@ -0,0 +1,123 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import status
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    name=IDEMPOTENCY_KEY_HEADER,
+    location=OpenApiParameter.HEADER,
+    description=(
+        'Unique key of the request, e.g. a UUID, that makes retries return the original response. '
+        'Requires authentication.'
+    ),
+    required=False,
+    type=str
+)
+
+
+def get_request_hash(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    return hashlib.sha256(json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+
+def claim_idempotency_key(lookup, request_hash):
+    '''
+    Returns a new record for the key, or the stored one when the key was already used.
+    A record still being processed after the processing lease ran out is taken over as if it were new.
+    '''
+    now = timezone.now()
+    expires_at = now + settings.IDEMPOTENCY_KEY_TTL
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(request_hash=request_hash, expires_at=expires_at, **lookup), True
+    except IntegrityError:
+        record = IdempotencyKey.objects.filter(**lookup).first()
+        if record is None or record.expires_at <= now:
+            # Expired or released in the meantime, the key can be used again
+            IdempotencyKey.objects.filter(**lookup, expires_at__lte=now).delete()
+            return claim_idempotency_key(lookup, request_hash)
+        lease_expired = record.created_at <= now - settings.IDEMPOTENCY_PROCESSING_LEASE
+        if record.status_code is None and record.request_hash == request_hash and lease_expired:
+            # The request that claimed the key died or hangs, the lease start tells the owners apart
+            taken_over = IdempotencyKey.objects.filter(
+                pk=record.pk, status_code__isnull=True, created_at=record.created_at
+            ).update(created_at=now, expires_at=expires_at)
+            if taken_over:
+                record.created_at, record.expires_at = now, expires_at
+                return record, True
+            return claim_idempotency_key(lookup, request_hash)
+        return record, False
+
+
+def idempotent(handler):
+    '''
+    Makes a POST handler replay its stored response to retries sent with the same Idempotency-Key header,
+    without running the handler again. Requests without the header are handled as usual, the header itself
+    needs authentication as keys are scoped by user.
+    Server errors are not stored so that the request can be retried with the same key.
+    '''
+    @wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if not key:
+            return handler(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{IDEMPOTENCY_KEY_HEADER} must be at most {MAX_KEY_LENGTH} characters long.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user = request.user
+        if not user.is_authenticated:
+            raise NotAuthenticated(f'Authentication is required to send an {IDEMPOTENCY_KEY_HEADER} header.')
+        lookup = {
+            'scope': f'user:{user.pk}',
+            'endpoint': f'{request.method} {request.path}',
+            'key': key,
+        }
+        request_hash = get_request_hash(request)
+        record, created = claim_idempotency_key(lookup, request_hash)
+
+        if not created:
+            if record.request_hash != request_hash:
+                return Response(
+                    {'error': f'{IDEMPOTENCY_KEY_HEADER} was already used for a different request.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if record.status_code is None:
+                return Response(
+                    {'error': f'A request with this {IDEMPOTENCY_KEY_HEADER} is still being processed.'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            return Response(record.response_body, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+
+        # Only touch the record while it is still ours, it is taken over once the processing lease runs out
+        owned = IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at)
+        try:
+            response = handler(view, request, *args, **kwargs)
+        except Exception:
+            owned.delete()
+            raise
+        if response.status_code >= 500:
+            owned.delete()
+        else:
+            owned.update(status_code=response.status_code, response_body=response.data)
+        return response
+
+    return wrapper
@@ -43,9 +43,11 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 MY_APPS = [
+    'core',
     'accounts',
     'establishments',
     'menu',
@@ -115,6 +117,18 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Invalidation of cached statistics, happy hours and subscriptions has to reach every worker process,
+# so deployments use a shared cache such as Redis (see docker-compose.yml), local memory is for development.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -211,6 +225,14 @@ SPECTACULAR_SETTINGS = {
     }
 }
 
+# Stored responses of POST requests sent with an Idempotency-Key header are replayed for this long
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# A request still being processed after this long is considered lost and a retry with its key takes over
+
+IDEMPOTENCY_PROCESSING_LEASE = timedelta(minutes=1)
+
 # CORS Headers django-cors-headers settings
 # https://pypi.org/project/django-cors-headers/
 
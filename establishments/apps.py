@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EstablishmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'establishments'
+
+    def ready(self):
+        import establishments.signals  # noqa
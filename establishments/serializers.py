@@ -61,3 +61,24 @@ class EstablishmentMapSerializer(serializers.ModelSerializer):
             'happy_hour_end',
             'logo'
         ]
+
+
+class HappyHourQuerySerializer(serializers.Serializer):
+    MAX_RADIUS = 50  # km
+
+    time = serializers.TimeField(required=False)
+    latitude = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    longitude = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    radius = serializers.FloatField(required=False, default=5, min_value=0, max_value=MAX_RADIUS)
+
+    def validate(self, attrs):
+        if ('latitude' in attrs) != ('longitude' in attrs):
+            raise serializers.ValidationError({'error': 'Latitude and longitude must be passed together.'})
+        return attrs
+
+
+class HappyHourEstablishmentSerializer(EstablishmentMapSerializer):
+    distance = serializers.FloatField(read_only=True, required=False, help_text='Distance in km from the given point.')
+
+    class Meta(EstablishmentMapSerializer.Meta):
+        fields = EstablishmentMapSerializer.Meta.fields + ['distance']
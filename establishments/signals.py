@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Establishment
+from .utils import invalidate_happy_hour_index
+
+
+@receiver(post_save, sender=Establishment)
+@receiver(post_delete, sender=Establishment)
+def refresh_happy_hour_index(sender, instance, **kwargs):
+    '''
+    Drops the happy hour index so that it is rebuilt with the changed establishment on next lookup.
+    '''
+    invalidate_happy_hour_index()
@@ -6,6 +6,7 @@ from .views import (
     EstablishmentDetailView,
     EstablishmentListCreateView,
     EstablishmentMapListView,
+    HappyHourEstablishmentListView,
     PartnerEstablishmentListView,
 )
 
@@ -16,4 +17,5 @@ urlpatterns = [
     path('banners/<int:pk>/', EstablishmentBannerDeleteView.as_view(), name='banner-delete'),
     path('partner/', PartnerEstablishmentListView.as_view(), name='partner-establishment-list'),
     path('all/', EstablishmentMapListView.as_view(), name='establishments-all'),
+    path('happy-hour/', HappyHourEstablishmentListView.as_view(), name='establishments-happy-hour'),
 ]
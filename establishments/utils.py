@@ -0,0 +1,96 @@
+import math
+from bisect import bisect_right
+
+from django.core.cache import cache
+
+from .models import Establishment
+
+HAPPY_HOUR_INDEX_CACHE_KEY = 'establishments:happy-hour-index'
+HAPPY_HOUR_INDEX_CACHE_TIMEOUT = 5 * 60  # seconds, bounds how long a process without the shared cache serves stale hours
+EARTH_RADIUS_KM = 6371.0
+MICROSECONDS_PER_DAY = 24 * 60 * 60 * 10**6
+
+
+def get_time_of_day(value):
+    '''
+    Microseconds since midnight of a time
+    '''
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 10**6 + value.microsecond
+
+
+def build_happy_hour_index():
+    '''
+    Splits the day into segments in which the set of establishments having happy hour does not change.
+    Returns the sorted segment starts and the establishment ids of every segment.
+    Windows spanning midnight are split in two, both window ends are inclusive.
+    '''
+    windows = []
+    rows = Establishment.objects.filter(
+        happy_hour_start__isnull=False, happy_hour_end__isnull=False
+    ).values_list('id', 'happy_hour_start', 'happy_hour_end')
+    for establishment_id, start, end in rows:
+        start, end = get_time_of_day(start), get_time_of_day(end) + 1
+        if start < end:
+            windows.append((start, end, establishment_id))
+        else:
+            windows.append((start, MICROSECONDS_PER_DAY, establishment_id))
+            windows.append((0, end, establishment_id))
+
+    changes = {0: ([], [])}
+    for start, end, establishment_id in windows:
+        changes.setdefault(start, ([], []))[0].append(establishment_id)
+        changes.setdefault(end, ([], []))[1].append(establishment_id)
+
+    boundaries, segments = [], []
+    active = set()
+    for boundary in sorted(changes):
+        if boundary == MICROSECONDS_PER_DAY:
+            break
+        opened, closed = changes[boundary]
+        active.difference_update(closed)
+        active.update(opened)
+        boundaries.append(boundary)
+        segments.append(sorted(active))
+    return boundaries, segments
+
+
+def get_happy_hour_index():
+    index = cache.get(HAPPY_HOUR_INDEX_CACHE_KEY)
+    if index is None:
+        index = build_happy_hour_index()
+        cache.set(HAPPY_HOUR_INDEX_CACHE_KEY, index, timeout=HAPPY_HOUR_INDEX_CACHE_TIMEOUT)
+    return index
+
+
+def invalidate_happy_hour_index():
+    cache.delete(HAPPY_HOUR_INDEX_CACHE_KEY)
+
+
+def get_happy_hour_establishment_ids(at_time):
+    '''
+    Ids of establishments having happy hour at the given local time
+    '''
+    boundaries, segments = get_happy_hour_index()
+    return segments[bisect_right(boundaries, get_time_of_day(at_time)) - 1]
+
+
+def get_distance_km(latitude, longitude, other_latitude, other_longitude):
+    '''
+    Great-circle distance between two points
+    '''
+    latitude, longitude, other_latitude, other_longitude = map(
+        math.radians, (latitude, longitude, other_latitude, other_longitude)
+    )
+    latitude_term = math.sin((other_latitude - latitude) / 2) ** 2
+    longitude_term = math.cos(latitude) * math.cos(other_latitude) * math.sin((other_longitude - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(latitude_term + longitude_term))
+
+
+def get_bounding_box(latitude, longitude, radius_km):
+    '''
+    Latitude and longitude ranges of a box enclosing the circle, used to narrow the query before exact distances
+    '''
+    latitude_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_latitude = math.cos(math.radians(latitude))
+    longitude_delta = 180 if cos_latitude < 1e-6 else min(180, latitude_delta / cos_latitude)
+    return (latitude - latitude_delta, latitude + latitude_delta), (longitude - longitude_delta, longitude + longitude_delta)
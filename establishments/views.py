@@ -1,6 +1,8 @@
-from drf_spectacular.utils import extend_schema
-from rest_framework import filters, generics
+from django.utils import timezone
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from rest_framework import filters, generics, status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from .models import Establishment, EstablishmentBanner
 from .permissions import IsPartnerOrReadOnly
@@ -8,7 +10,10 @@ from .serializers import (
     EstablishmentBannerSerializer,
     EstablishmentMapSerializer,
     EstablishmentSerializer,
+    HappyHourEstablishmentSerializer,
+    HappyHourQuerySerializer,
 )
+from .utils import get_bounding_box, get_distance_km, get_happy_hour_establishment_ids
 
 
 class EstablishmentListCreateView(generics.ListCreateAPIView):
@@ -149,6 +154,63 @@ class EstablishmentMapListView(generics.ListAPIView):
         return super().get(request, *args, **kwargs)
 
 
+class HappyHourEstablishmentListView(generics.GenericAPIView):
+    '''
+    Establishments having happy hour at a given time, optionally near a point
+    '''
+    queryset = Establishment.objects.all()
+    serializer_class = HappyHourEstablishmentSerializer
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary='Get establishments with happy hour now',
+        description=(
+            'Returns establishments whose happy hour is running at the given local time, now by default.\n'
+            'Pass latitude and longitude to only get establishments within the radius, nearest first.\n'
+            '- Requires authentication.'
+        ),
+        parameters=[
+            OpenApiParameter(name='time', description='Local time in HH:MM format.', required=False, type=str),
+            OpenApiParameter(name='latitude', description='Latitude of the point.', required=False, type=float),
+            OpenApiParameter(name='longitude', description='Longitude of the point.', required=False, type=float),
+            OpenApiParameter(
+                name='radius',
+                description=f'Radius around the point in km, at most {HappyHourQuerySerializer.MAX_RADIUS}.',
+                required=False,
+                type=float,
+                default=5
+            )
+        ],
+        responses=HappyHourEstablishmentSerializer(many=True)
+    )
+    def get(self, request, *args, **kwargs):
+        query_serializer = HappyHourQuerySerializer(data=request.query_params)
+        if not query_serializer.is_valid():
+            return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query_serializer.validated_data
+
+        at_time = params.get('time') or timezone.localtime(timezone.now()).time()
+        establishment_ids = get_happy_hour_establishment_ids(at_time)
+        if not establishment_ids:
+            return Response([])
+        establishments = self.get_queryset().filter(id__in=establishment_ids)
+
+        if 'latitude' in params:
+            latitude, longitude, radius = params['latitude'], params['longitude'], params['radius']
+            latitude_range, longitude_range = get_bounding_box(latitude, longitude, radius)
+            nearby = []
+            for establishment in establishments.filter(latitude__range=latitude_range, longitude__range=longitude_range):
+                establishment.distance = get_distance_km(
+                    latitude, longitude, float(establishment.latitude), float(establishment.longitude)
+                )
+                if establishment.distance <= radius:
+                    nearby.append(establishment)
+            establishments = sorted(nearby, key=lambda establishment: establishment.distance)
+
+        serializer = self.get_serializer(establishments, many=True)
+        return Response(serializer.data)
+
+
 class PartnerEstablishmentListView(generics.ListAPIView):
     '''
     This view for partners to see their list of establishments
@@ -0,0 +1,69 @@
+from functools import lru_cache
+
+import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast, Coalesce
+from rest_framework import filters
+
+from .models import SEARCH_CONFIG, Beverage
+
+
+@lru_cache
+def has_trigram_extension(alias):
+    '''
+    Whether pg_trgm is installed in the database, migrations leave it out on servers that do not ship it
+    '''
+    with connections[alias].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+class BeverageSearchFilter(filters.SearchFilter):
+    '''
+    Ranked full-text search over beverage names, categories and descriptions that also finds names
+    typed with mistakes through trigram similarity. Postgres only, like the search vectors it reads.
+    '''
+
+    def filter_queryset(self, request, queryset, view):
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+
+        query = SearchQuery(terms, search_type='websearch', config=SEARCH_CONFIG)
+        matches = Q(search_vector=query)
+        rank = Coalesce(SearchRank(F('search_vector'), query), Value(0.0))
+        if has_trigram_extension(queryset.db):
+            matches |= Q(name__trigram_similar=terms)
+            rank += TrigramSimilarity('name', terms)
+        try:
+            # Only finite prices that fit the column, anything else would fail in the database
+            matches |= Q(price=Beverage._meta.get_field('price').clean(terms, None))
+        except ValidationError:
+            pass
+        # Postgres ranks are single precision, in double precision they compare exactly against cursor positions
+        rank = Cast(rank, FloatField())
+        return queryset.filter(matches).annotate(rank=rank).order_by('-rank', 'id')
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    pass
+
+
+class BeverageCatalogFilter(django_filters.FilterSet):
+    category = NumberInFilter(field_name='category_id')
+    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+    establishment = django_filters.NumberFilter(field_name='menu__establishment_id')
+
+    class Meta:
+        model = Beverage
+        fields = ['category', 'min_price', 'max_price', 'in_stock', 'establishment']
+
+    def filter_in_stock(self, queryset, name, value):
+        if value:
+            return queryset.filter(in_stock__gt=0)
+        return queryset.filter(in_stock=0)
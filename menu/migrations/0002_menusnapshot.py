@@ -0,0 +1,28 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MenuSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.DateTimeField()),
+                ('etag', models.CharField(max_length=64)),
+                ('body', models.BinaryField()),
+                ('menu', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='menu.menu')),
+            ],
+            options={
+                'verbose_name': 'Menu Snapshot',
+                'verbose_name_plural': 'Menu Snapshots',
+            },
+        ),
+    ]
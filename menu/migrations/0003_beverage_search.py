@@ -0,0 +1,63 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:48
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+
+def backfill_search_vectors(apps, schema_editor):
+    Beverage = apps.get_model('menu', 'Beverage')
+    Category = apps.get_model('menu', 'Category')
+    category_name = models.Subquery(
+        Category._default_manager.filter(id=models.OuterRef('category_id')).values('name')
+    )
+    name = SearchVector('name', weight='A', config='simple')
+    category = SearchVector(category_name, weight='B', config='simple')
+    description = SearchVector('description', weight='C', config='simple')
+    Beverage._default_manager.update(search_vector=name + category + description)
+
+
+def create_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            # Search goes without typo tolerance on servers that do not ship pg_trgm
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute('CREATE INDEX IF NOT EXISTS beverage_name_trgm_idx ON menu_beverage USING gin (name gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX IF EXISTS beverage_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_menusnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='beverage',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='beverage',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='beverage_search_vector_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='beverage',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='beverage_name_trgm_idx', opclasses=['gin_trgm_ops']),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_trigram_index, drop_trigram_index),
+            ],
+        ),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
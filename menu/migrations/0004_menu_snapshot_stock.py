@@ -0,0 +1,34 @@
+# Generated by Django 5.0.4 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+def drop_snapshots(apps, schema_editor):
+    # Snapshots without stock offsets are rendered again on their next request
+    apps.get_model('menu', 'MenuSnapshot')._default_manager.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0003_beverage_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='beverage',
+            name='stock_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='menusnapshot',
+            name='stock_offsets',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='menusnapshot',
+            name='stock_version',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(drop_snapshots, migrations.RunPython.noop),
+    ]
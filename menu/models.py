@@ -1,8 +1,15 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models.functions import Now
+from django.utils import timezone
 
-from core.models import BaseModel
+from core.models import BaseModel, BaseModelManager
 from establishments.models import Establishment
 
+# Beverage names are not all English, so search does not stem words
+SEARCH_CONFIG = 'simple'
+
 
 class Category(BaseModel):
     name = models.CharField(max_length=255)
@@ -28,6 +35,55 @@ class Menu(BaseModel):
         return f'{self.id}'
 
 
+class BeverageManager(BaseModelManager):
+    def reserve_stock(self, beverage_id, quantity):
+        '''
+        Takes the quantity out of stock in a single conditional update, without reading the row first.
+        Returns False when there is not enough in stock. Menus are left untouched, their snapshots splice in
+        stock changed after they were rendered.
+        '''
+        return bool(self.filter(id=beverage_id, in_stock__gte=quantity).update(
+            in_stock=models.F('in_stock') - quantity, stock_updated_at=Now()
+        ))
+
+    def release_stock(self, beverage_id, quantity):
+        '''
+        Puts the quantity back in stock, e.g. when an order is cancelled.
+        '''
+        Beverage.everything.filter(id=beverage_id).update(
+            in_stock=models.F('in_stock') + quantity, stock_updated_at=Now()
+        )
+
+    def get_stock_version(self, menu_ref):
+        '''
+        Subquery of the last stock change of a menu's beverages through reservations and releases
+        '''
+        return models.Subquery(
+            self.filter(menu=menu_ref).order_by().values('menu').annotate(
+                last_change=models.Max('stock_updated_at')
+            ).values('last_change')
+        )
+
+    def touch_menus(self, **filters):
+        '''
+        Bumps the last change time of menus holding beverages that match the filters, for changes made
+        without saving the menu so that its snapshot gets rebuilt.
+        '''
+        menu_ids = Beverage.everything.filter(**filters).values('menu_id')
+        Menu.everything.filter(id__in=menu_ids).update(updated_at=timezone.now())
+
+    def update_search_vectors(self, **filters):
+        '''
+        Recomputes the full-text search document of beverages matching the filters from their name,
+        category name and description, in that order of weight.
+        '''
+        category_name = models.Subquery(Category.everything.filter(id=models.OuterRef('category_id')).values('name'))
+        name = SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        category = SearchVector(category_name, weight='B', config=SEARCH_CONFIG)
+        description = SearchVector('description', weight='C', config=SEARCH_CONFIG)
+        Beverage.everything.filter(**filters).update(search_vector=name + category + description)
+
+
 class Beverage(BaseModel):
     menu = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name='beverages')
     name = models.CharField(max_length=255)
@@ -35,10 +91,50 @@ class Beverage(BaseModel):
     price = models.DecimalField(max_digits=8, decimal_places=2)
     description = models.TextField(null=True, blank=True)
     in_stock = models.PositiveIntegerField(default=0)
+    # Maintained by BeverageManager.reserve_stock and release_stock
+    stock_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Maintained by BeverageManager.update_search_vectors
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    everything = models.Manager()  # Redeclared to stay the default manager
+    objects = BeverageManager()
 
     class Meta:
         verbose_name = 'Beverage'
         verbose_name_plural = 'Beverages'
+        indexes = [
+            GinIndex(fields=['search_vector'], name='beverage_search_vector_idx'),
+            # Trigram similarity on names, for searches with typos, only created where pg_trgm is available
+            GinIndex(fields=['name'], opclasses=['gin_trgm_ops'], name='beverage_name_trgm_idx'),
+        ]
 
     def __str__(self):
         return f'{self.id}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Kept to find the menu a beverage was moved away from
+        instance._loaded_menu_id = instance.__dict__.get('menu_id')
+        return instance
+
+
+class MenuSnapshot(models.Model):
+    '''
+    Rendered JSON of a menu as of its last change, served as is while the menu's updated_at stays the same.
+    Stock changed by orders later on is spliced into the body at the stored offsets of the in_stock values.
+    '''
+    menu = models.OneToOneField(Menu, on_delete=models.CASCADE, related_name='snapshot')
+    version = models.DateTimeField()
+    stock_version = models.DateTimeField(null=True, blank=True)
+    etag = models.CharField(max_length=64)
+    body = models.BinaryField()
+    # [beverage id, start, end] of every in_stock value in the body
+    stock_offsets = models.JSONField(default=list)
+
+    class Meta:
+        verbose_name = 'Menu Snapshot'
+        verbose_name_plural = 'Menu Snapshots'
+
+    def __str__(self):
+        return f'Menu {self.menu_id} as of {self.version}'
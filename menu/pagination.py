@@ -0,0 +1,18 @@
+from rest_framework.pagination import CursorPagination
+
+
+class BeverageCatalogPagination(CursorPagination):
+    '''
+    Cursor pagination over the catalog, cheapest beverages first or the most relevant ones when searching
+    '''
+    ordering = ('price', 'id')
+    search_ordering = ('-rank', 'id')
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        if 'rank' in queryset.query.annotations:
+            # Annotated by the search filter
+            return self.search_ordering
+        return super().get_ordering(request, queryset, view)
@@ -1,3 +1,8 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import timezone
 from rest_framework import serializers
 
 from establishments.models import Establishment
@@ -20,27 +25,146 @@ class BeverageSerializer(serializers.ModelSerializer):
         fields = ['id', 'menu', 'name', 'category', 'price', 'description', 'in_stock']
 
 
+class CatalogBeverageSerializer(serializers.ModelSerializer):
+    '''
+    Beverage of any venue along with where it is served
+    '''
+    category_name = serializers.CharField(source='category.name', read_only=True, allow_null=True)
+    establishment_id = serializers.IntegerField(source='menu.establishment_id', read_only=True)
+    establishment_name = serializers.CharField(source='menu.establishment.name', read_only=True)
+
+    class Meta:
+        model = Beverage
+        fields = [
+            'id',
+            'menu',
+            'name',
+            'category',
+            'category_name',
+            'price',
+            'description',
+            'in_stock',
+            'establishment_id',
+            'establishment_name'
+        ]
+
+
+class CategoryFacetSerializer(serializers.Serializer):
+    id = serializers.IntegerField(allow_null=True)
+    name = serializers.CharField(allow_null=True)
+    count = serializers.IntegerField()
+
+
+class PriceFacetSerializer(serializers.Serializer):
+    min_price = serializers.DecimalField(max_digits=8, decimal_places=2)
+    max_price = serializers.DecimalField(max_digits=8, decimal_places=2, allow_null=True)
+    count = serializers.IntegerField()
+
+
+class CatalogFacetsSerializer(serializers.Serializer):
+    categories = CategoryFacetSerializer(many=True)
+    prices = PriceFacetSerializer(many=True)
+
+
 class MenuSerializer(serializers.ModelSerializer):
     establishment = serializers.PrimaryKeyRelatedField(
         queryset=Establishment.objects.all()
     )
-    beverages = BeverageSerializer(many=True, read_only=True)
+    beverages = BeverageSerializer(source='visible_beverages', many=True, read_only=True)
 
     class Meta:
         model = Menu
         fields = ['id', 'establishment', 'created_at', 'updated_at', 'beverages']
 
+    @staticmethod
+    def get_beverages_prefetch(request=None):
+        '''
+        Prefetch of the beverages shown on menus, non-deleted ones optionally filtered by `beverage__name`
+        '''
+        beverages = Beverage.objects.order_by('id')
+        beverage_name = request.query_params.get('beverage__name') if request else None
+        if beverage_name:
+            beverages = beverages.filter(name__icontains=beverage_name)
+        return Prefetch('beverages', queryset=beverages, to_attr='visible_beverages')
+
     def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        request = self.context.get('request')
+        if not hasattr(instance, 'visible_beverages'):
+            # Menus that did not come from a view's queryset, e.g. a freshly created one
+            prefetch_related_objects([instance], self.get_beverages_prefetch(self.context.get('request')))
+        return super().to_representation(instance)
+
+
+class BeverageImportRowSerializer(serializers.Serializer):
+    '''
+    One beverage of a bulk import, matched to the menu's beverages by name
+    '''
+    name = serializers.CharField(max_length=255)
+    category = serializers.IntegerField(required=False, allow_null=True)
+    price = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=Decimal('0'), required=False)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    in_stock = serializers.IntegerField(min_value=0, required=False)
+
+    def validate_category(self, value):
+        if value is not None and value not in self.context['category_ids']:
+            raise serializers.ValidationError(f'Category with ID {value} does not exist.')
+        return value
+
+    def validate(self, attrs):
+        if attrs['name'].lower() not in self.context['beverages'] and 'price' not in attrs:
+            raise serializers.ValidationError({'price': 'This field is required for new beverages.'})
+        return attrs
+
+
+class BeverageImportSerializer(serializers.Serializer):
+    '''
+    Creates and updates many beverages of a menu at once, rows naming an existing beverage of the menu update it.
+    Rows are validated against categories and beverages loaded up front, nothing is written unless all rows are valid.
+    '''
+    MAX_ROWS = 1000
+
+    beverages = BeverageImportRowSerializer(many=True, allow_empty=False, max_length=MAX_ROWS, write_only=True)
+    created = serializers.IntegerField(read_only=True)
+    updated = serializers.IntegerField(read_only=True)
+
+    def run_validation(self, data=serializers.empty):
+        # Rows are checked against these, each loaded with a single query
+        menu = self.context['menu']
+        self.context['category_ids'] = set(Category.objects.values_list('id', flat=True))
+        self.context['beverages'] = {beverage.name.lower(): beverage for beverage in menu.beverages.filter(is_deleted=False)}
+        return super().run_validation(data)
+
+    def validate_beverages(self, rows):
+        seen, errors = set(), []
+        for row in rows:
+            name = row['name'].lower()
+            errors.append({'name': ['Beverage is listed more than once.']} if name in seen else {})
+            seen.add(name)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return rows
+
+    def create(self, validated_data):
+        menu = self.context['menu']
+        existing = self.context['beverages']
+        to_create, to_update, updated_fields = [], [], set()
 
-        beverages = instance.beverages.filter(is_deleted=False)
+        for row in validated_data['beverages']:
+            values = {('category_id' if field == 'category' else field): value for field, value in row.items()}
+            beverage = existing.get(row['name'].lower())
+            if beverage is None:
+                to_create.append(Beverage(menu=menu, **values))
+                continue
+            for field, value in values.items():
+                setattr(beverage, field, value)
+            updated_fields.update(values)
+            to_update.append(beverage)
 
-        if request:
-            beverage_name = request.query_params.get('beverage__name')
-            if beverage_name:
-                beverages = instance.beverages.filter(name__icontains=beverage_name)
-        beverage_serializer = BeverageSerializer(beverages, many=True, context=self.context)
-        representation['beverages'] = beverage_serializer.data
+        # Bulk writes skip save signals, so search documents and the menu snapshot are refreshed here
+        with transaction.atomic():
+            Beverage.objects.bulk_create(to_create, batch_size=500)
+            if to_update:
+                Beverage.objects.bulk_update(to_update, sorted(updated_fields), batch_size=500)
+            Beverage.objects.update_search_vectors(menu=menu)
+            Menu.everything.filter(id=menu.id).update(updated_at=timezone.now())
 
-        return representation
+        return {'created': len(to_create), 'updated': len(to_update)}
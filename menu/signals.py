@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Beverage, Category, Menu
+
+
+@receiver(post_save, sender=Beverage)
+@receiver(post_delete, sender=Beverage)
+def touch_beverage_menus(sender, instance, raw=False, **kwargs):
+    '''
+    Marks the menu of a changed beverage, and the one it was moved away from, as changed.
+    '''
+    if raw:
+        return
+    menu_ids = {instance.menu_id, getattr(instance, '_loaded_menu_id', None)} - {None}
+    Menu.everything.filter(id__in=menu_ids).update(updated_at=timezone.now())
+    instance._loaded_menu_id = instance.menu_id
+
+
+@receiver(post_save, sender=Beverage)
+def update_beverage_search_vector(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Beverage.objects.update_search_vectors(id=instance.id)
+
+
+@receiver(post_save, sender=Category)
+def update_category_search_vectors(sender, instance, created, raw=False, **kwargs):
+    '''
+    Beverages are found by the name of their category as well.
+    '''
+    if raw or created:
+        return
+    Beverage.objects.update_search_vectors(category=instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def touch_category_menus(sender, instance, raw=False, **kwargs):
+    '''
+    Marks menus with beverages of a changed category as changed, deleting a category unsets it on its beverages.
+    '''
+    if raw:
+        return
+    Beverage.objects.touch_menus(category=instance)
@@ -1,10 +1,12 @@
 from django.urls import path
 
 from .views import (
+    BeverageCatalogView,
     BeverageDetailView,
     BeverageListCreateView,
     CategoryDetailView,
     CategoryListCreateView,
+    MenuBeverageImportView,
     MenuDetailView,
     MenuListCreateView,
 )
@@ -14,6 +16,8 @@ urlpatterns = [
     path('categories/<int:pk>/', CategoryDetailView.as_view(), name='category-detail'),
     path('menus/', MenuListCreateView.as_view(), name='menu-list'),
     path('menus/<int:pk>/', MenuDetailView.as_view(), name='menu-detail'),
+    path('menus/<int:pk>/beverages/import/', MenuBeverageImportView.as_view(), name='menu-beverage-import'),
     path('beverages/', BeverageListCreateView.as_view(), name='beverage-list'),
+    path('beverages/catalog/', BeverageCatalogView.as_view(), name='beverage-catalog'),
     path('beverages/<int:pk>/', BeverageDetailView.as_view(), name='beverage-detail'),
 ]
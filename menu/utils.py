@@ -0,0 +1,135 @@
+import hashlib
+import json
+import re
+from functools import cached_property
+
+from django.db.models import Count, Q, prefetch_related_objects
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import Beverage, MenuSnapshot
+from .serializers import MenuSerializer
+
+# Catalog price facet boundaries, the last bucket has no upper bound
+PRICE_BUCKETS = (0, 100, 200, 300, 500, 1000)
+STOCK_MARKER = '@@in_stock:{}@@'
+STOCK_MARKER_PATTERN = re.compile(rb'"@@in_stock:(\d+)@@"')
+
+
+def get_menu_snapshot(menu):
+    '''
+    Returns the snapshot of the menu as of its last change, rendering and storing it when it is missing or stale.
+    The menu is expected to come with its snapshot selected and its stock_version annotated.
+    '''
+    try:
+        snapshot = menu.snapshot
+    except MenuSnapshot.DoesNotExist:
+        snapshot = None
+    if snapshot is not None and snapshot.version == menu.updated_at:
+        return snapshot
+
+    # updated_at and stock_version were read before the beverages, so changes made in between leave the snapshot stale
+    prefetch_related_objects([menu], MenuSerializer.get_beverages_prefetch())
+    body, stock_offsets = render_menu(menu)
+    snapshot, _ = MenuSnapshot.objects.update_or_create(menu=menu, defaults={
+        'version': menu.updated_at,
+        'stock_version': menu.stock_version,
+        'etag': hashlib.md5(body).hexdigest(),
+        'body': body,
+        'stock_offsets': stock_offsets,
+    })
+    return snapshot
+
+
+def render_menu(menu):
+    '''
+    Renders the menu's JSON, returns it along with the [beverage id, start, end] offsets of its in_stock values.
+    Quoted markers stand in for the values while rendering, JSON strings from user input cannot contain them
+    as their quotes would be escaped.
+    '''
+    data = MenuSerializer(menu).data
+    stock = {}
+    for beverage in data['beverages']:
+        stock[beverage['id']] = beverage['in_stock']
+        beverage['in_stock'] = STOCK_MARKER.format(beverage['id'])
+
+    body, stock_offsets = bytearray(), []
+    for i, part in enumerate(STOCK_MARKER_PATTERN.split(JSONRenderer().render(data))):
+        if i % 2:
+            beverage_id, value = int(part), str(stock[int(part)]).encode()
+            stock_offsets.append([beverage_id, len(body), len(body) + len(value)])
+            part = value
+        body += part
+    return bytes(body), stock_offsets
+
+
+def get_stock_etag(snapshot, stock_version):
+    return f'{snapshot.etag}-{stock_version.timestamp() if stock_version else 0}'
+
+
+def get_stock_changes(menu, since):
+    '''
+    Stock by beverage id of the menu's beverages whose stock changed after the given stock version
+    '''
+    beverages = Beverage.objects.filter(menu=menu, stock_updated_at__isnull=False)
+    if since is not None:
+        beverages = beverages.filter(stock_updated_at__gt=since)
+    return dict(beverages.values_list('id', 'in_stock'))
+
+
+def splice_stock(snapshot, stock):
+    '''
+    Returns the snapshot's body with the given stock by beverage id put in place of the rendered values.
+    '''
+    body, parts, position = bytes(snapshot.body), [], 0
+    for beverage_id, start, end in snapshot.stock_offsets:
+        value = str(stock[beverage_id]).encode() if beverage_id in stock else body[start:end]
+        parts += [body[position:start], value]
+        position = end
+    parts.append(body[position:])
+    return b''.join(parts)
+
+
+class SnapshotResponse(Response):
+    '''
+    Sends the stored JSON of a snapshot as is, its data is only decoded when someone asks for it, e.g. tests.
+    '''
+
+    def __init__(self, body, status=None, headers=None):
+        super().__init__(status=status, headers=headers)
+        del self.data
+        self.body = bytes(body)
+
+    @cached_property
+    def data(self):
+        return json.loads(self.body)
+
+    @property
+    def rendered_content(self):
+        self['Content-Type'] = 'application/json'
+        return self.body
+
+
+def get_category_facets(queryset):
+    '''
+    Number of beverages per category, in a single grouped query
+    '''
+    rows = queryset.order_by().values('category_id', 'category__name').annotate(
+        count=Count('id')
+    ).order_by('-count', 'category_id')
+    return [{'id': row['category_id'], 'name': row['category__name'], 'count': row['count']} for row in rows]
+
+
+def get_price_facets(queryset):
+    '''
+    Number of beverages per price bucket, counted with conditional aggregates in a single query
+    '''
+    buckets = list(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + (None,)))
+    counts = queryset.order_by().aggregate(**{
+        f'bucket_{index}': Count('id', filter=Q(price__gte=low) & (Q(price__lt=high) if high else Q()))
+        for index, (low, high) in enumerate(buckets)
+    })
+    return [
+        {'min_price': low, 'max_price': high, 'count': counts[f'bucket_{index}']}
+        for index, (low, high) in enumerate(buckets)
+    ]
@@ -1,11 +1,38 @@
+import csv
+
+from django.db.models import OuterRef
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags, quote_etag
+from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import OpenApiParameter, extend_schema
-from rest_framework import filters, generics
+from rest_framework import generics, status
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from establishments.permissions import IsPartnerOrReadOnly
 
+from .filters import BeverageCatalogFilter, BeverageSearchFilter
 from .models import Beverage, Category, Menu
+from .pagination import BeverageCatalogPagination
 from .permissions import IsAdminOrReadOnly
-from .serializers import BeverageSerializer, CategorySerializer, MenuSerializer
+from .serializers import (
+    BeverageImportSerializer,
+    BeverageSerializer,
+    CatalogBeverageSerializer,
+    CatalogFacetsSerializer,
+    CategorySerializer,
+    MenuSerializer,
+)
+from .utils import (
+    SnapshotResponse,
+    get_category_facets,
+    get_menu_snapshot,
+    get_price_facets,
+    get_stock_changes,
+    get_stock_etag,
+    splice_stock,
+)
 
 
 class CategoryListCreateView(generics.ListCreateAPIView):
@@ -124,7 +151,9 @@ class MenuListCreateView(generics.ListCreateAPIView):
 
         partner = self.request.user
 
-        queryset = Menu.objects.filter(establishment__owner=partner)
+        queryset = Menu.objects.filter(establishment__owner=partner).prefetch_related(
+            MenuSerializer.get_beverages_prefetch(self.request)
+        )
 
         return queryset
 
@@ -138,6 +167,8 @@ class MenuDetailView(generics.RetrieveUpdateDestroyAPIView):
         summary='Get menu',
         description=(
             'Retrieves specific menu.\n'
+            '- Unfiltered menus are served from a snapshot rendered on the menu\'s last change with up to date stock, '
+            'pass the `ETag` of a previous response in `If-None-Match` to get 304 while it is unchanged.\n'
             '- Requires authentication.\n'
             '- Permission: Authenticated only.'
         ),
@@ -151,7 +182,25 @@ class MenuDetailView(generics.RetrieveUpdateDestroyAPIView):
         ]
     )
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        if request.query_params.get('beverage__name'):
+            return super().get(request, *args, **kwargs)
+
+        menus = Menu.objects.select_related('snapshot').annotate(
+            stock_version=Beverage.objects.get_stock_version(OuterRef('pk'))
+        )
+        menu = get_object_or_404(menus, pk=kwargs['pk'])
+        self.check_object_permissions(request, menu)
+        snapshot = get_menu_snapshot(menu)
+        etag = quote_etag(get_stock_etag(snapshot, menu.stock_version))
+
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        if menu.stock_version == snapshot.stock_version:
+            return SnapshotResponse(snapshot.body, headers={'ETag': etag})
+        # Orders changed stock since the snapshot was rendered
+        stock = get_stock_changes(menu, snapshot.stock_version)
+        return SnapshotResponse(splice_stock(snapshot, stock), headers={'ETag': etag})
 
     @extend_schema(
         summary='Update menu',
@@ -186,19 +235,83 @@ class MenuDetailView(generics.RetrieveUpdateDestroyAPIView):
     def delete(self, request, *args, **kwargs):
         return super().delete(request, *args, **kwargs)
 
+    def get_queryset(self):
+        return Menu.objects.prefetch_related(MenuSerializer.get_beverages_prefetch(self.request))
+
+
+class MenuBeverageImportView(generics.GenericAPIView):
+    '''
+    Create and update many beverages of a partner's menu at once, from JSON or a CSV file
+    '''
+    serializer_class = BeverageImportSerializer
+    permission_classes = [IsPartnerOrReadOnly]
+    parser_classes = [JSONParser, MultiPartParser]
+    CSV_COLUMNS = ('name', 'category', 'price', 'description', 'in_stock')
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            # Returning an empty queryset to avoid errors during schema generation
+            return Menu.objects.none()
+        return Menu.objects.filter(establishment__owner=self.request.user)
+
+    @extend_schema(
+        summary='Import beverages',
+        description=(
+            'Creates the listed beverages in the menu, a beverage named like one already on the menu '
+            'is updated instead, with only the given fields changed.\n'
+            f'- Send JSON with a `beverages` list, or a CSV `file` with the columns {", ".join(CSV_COLUMNS)}.\n'
+            f'- At most {BeverageImportSerializer.MAX_ROWS} beverages per request.\n'
+            '- Nothing is saved unless every row is valid, errors are reported per row, starting from 1.\n'
+            '- Requires authentication.\n'
+            '- Permission: Partner owning the menu only.'
+        )
+    )
+    def post(self, request, *args, **kwargs):
+        menu = self.get_object()
+        upload = request.FILES.get('file')
+        if upload:
+            try:
+                data = {'beverages': self.read_csv(upload)}
+            except (UnicodeDecodeError, csv.Error):
+                return Response({'file': ['File must be a UTF-8 encoded CSV.']}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            data = request.data
+
+        serializer = self.get_serializer(data=data)
+        serializer.context['menu'] = menu
+        if not serializer.is_valid():
+            row_errors = serializer.errors.get('beverages')
+            if isinstance(row_errors, list):
+                errors = [{'row': row, 'errors': error} for row, error in enumerate(row_errors, start=1) if error]
+                return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def read_csv(self, upload):
+        '''
+        Rows of the file as dicts of the known columns, empty cells are left out
+        '''
+        lines = upload.read().decode('utf-8-sig').splitlines()
+        return [
+            {column: value for column, value in row.items() if column in self.CSV_COLUMNS and value}
+            for row in csv.DictReader(lines)
+        ]
+
 
 class BeverageListCreateView(generics.ListCreateAPIView):
     queryset = Beverage.objects.all()
     serializer_class = BeverageSerializer
     permission_classes = [IsPartnerOrReadOnly]
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'price', 'category__name']
+    filter_backends = [BeverageSearchFilter]
+    search_fields = ['name', 'price', 'category__name', 'description']
 
     @extend_schema(
         summary='Get beverages',
         description=(
             'Allows to get list of paginated beverages. '
-            'Search can be made by name, price and category name.\n'
+            'Search can be made by name, price, category name and description.\n'
+            '- Search results are ranked by relevance, names with typos are found as well.\n'
             '- Requires authentication.\n'
             '- Permission: Allowed to anyone.'
         )
@@ -266,3 +379,54 @@ class BeverageDetailView(generics.RetrieveUpdateDestroyAPIView):
     )
     def delete(self, request, *args, **kwargs):
         return super().delete(request, *args, **kwargs)
+
+
+class BeverageCatalogView(generics.ListAPIView):
+    '''
+    Beverages of all venues with filters and facet counts, for discovery screens
+    '''
+    serializer_class = CatalogBeverageSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = BeverageCatalogPagination
+    filter_backends = [DjangoFilterBackend, BeverageSearchFilter]
+    filterset_class = BeverageCatalogFilter
+    search_fields = ['name', 'category__name', 'description']
+    # Every facet leaves out the filters of its own dimension, so that it still shows the other options
+    FACET_EXCLUDED_FILTERS = {
+        'categories': ('category',),
+        'prices': ('min_price', 'max_price'),
+    }
+
+    @extend_schema(
+        summary='Get beverage catalog',
+        description=(
+            'Beverages of all establishments in cursor paginated pages, cheapest first, most relevant first '
+            'when searching with `search`.\n'
+            '- Filter by `category` (comma separated ids), `min_price`, `max_price`, `in_stock` and `establishment`, '
+            'search with `search`.\n'
+            '- `facets` holds the number of matching beverages per category and per price bucket. '
+            'Category counts ignore the category filter and price counts ignore the price filters.\n'
+            '- Requires authentication.'
+        )
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return Beverage.objects.filter(menu__is_deleted=False).select_related('category', 'menu__establishment')
+
+    def get_facet_queryset(self, facet):
+        params = self.request.query_params.copy()
+        for name in self.FACET_EXCLUDED_FILTERS[facet]:
+            params.pop(name, None)
+        queryset = self.filterset_class(params, queryset=self.get_queryset(), request=self.request).qs
+        return BeverageSearchFilter().filter_queryset(self.request, queryset, self)
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        facets = {
+            'categories': get_category_facets(self.get_facet_queryset('categories')),
+            'prices': get_price_facets(self.get_facet_queryset('prices')),
+        }
+        response.data['facets'] = CatalogFacetsSerializer(facets).data
+        return response
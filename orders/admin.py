@@ -6,7 +6,7 @@ from .models import Order
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('user', 'menu', 'beverage', 'order_date', 'status', 'quantity')
     list_filter = ('status', 'menu', 'beverage', 'user')
-    search_fields = ('user__email', 'menu__establishment__name', 'beverage__name', 'status')
+    search_fields = ('user__email', 'establishment__name', 'beverage__name', 'status')
     date_hierarchy = 'order_date'
     readonly_fields = ('order_date', 'last_updated')
     fieldsets = (
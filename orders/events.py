@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class OrderEventSubscription:
+    '''
+    Wake-up flag of a single stream, set from any thread when the partner's orders change.
+    '''
+
+    def __init__(self, partner_id, loop):
+        self.partner_id = partner_id
+        self.loop = loop
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        self.loop.call_soon_threadsafe(self.changed.set)
+
+    async def wait(self, timeout):
+        '''
+        Returns True when notified within the timeout, False otherwise.
+        '''
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.changed.clear()
+        return True
+
+
+class OrderEventBroker:
+    '''
+    In-process pub/sub telling open order streams that a partner's orders changed.
+    Streams read the changes from the database themselves, so a notification carries no payload
+    and a missed one is picked up by the next periodic check.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def subscribe(self, partner_id):
+        subscription = OrderEventSubscription(partner_id, asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions[partner_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.partner_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[subscription.partner_id]
+
+    def publish(self, partner_id):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(partner_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.notify()
+            except RuntimeError:
+                # The stream's event loop is already closed
+                self.unsubscribe(subscription)
+
+
+order_events = OrderEventBroker()
+
+
+def encode_event_id(last_updated, order_id):
+    return f'{(last_updated - EPOCH) // timedelta(microseconds=1)}-{order_id}'
+
+
+def decode_event_id(event_id):
+    '''
+    Returns the (last updated, order id) position an event id points at, or None when it is malformed.
+    '''
+    try:
+        microseconds, order_id = event_id.split('-')
+        return EPOCH + timedelta(microseconds=int(microseconds)), int(order_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
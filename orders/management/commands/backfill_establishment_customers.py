@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from orders.models import EstablishmentCustomer
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the establishment customer table from existing orders.'
+
+    def handle(self, *args, **options):
+        rows = EstablishmentCustomer.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} establishment customer rows.'))
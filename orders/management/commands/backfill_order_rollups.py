@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from orders.models import OrderDailyRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily order rollup table from existing orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--establishment',
+            type=int,
+            help='Only rebuild rollups of the establishment with the given id.'
+        )
+
+    def handle(self, *args, **options):
+        rows = OrderDailyRollup.objects.rebuild(establishment_id=options['establishment'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} daily order rollup rows.'))
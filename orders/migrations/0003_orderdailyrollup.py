@@ -0,0 +1,36 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('establishments', '0001_initial'),
+        ('menu', '0001_initial'),
+        ('orders', '0002_alter_order_managers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('beverage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_rollups', to='menu.beverage')),
+                ('establishment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_rollups', to='establishments.establishment')),
+            ],
+            options={
+                'verbose_name': 'Order Daily Rollup',
+                'verbose_name_plural': 'Order Daily Rollups',
+                'indexes': [models.Index(fields=['establishment', 'day'], name='order_rollup_establishment_day')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='orderdailyrollup',
+            constraint=models.UniqueConstraint(fields=('establishment', 'beverage', 'day'), name='unique_order_daily_rollup'),
+        ),
+    ]
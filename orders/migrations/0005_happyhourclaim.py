@@ -0,0 +1,53 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:25
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_recent_claims(apps, schema_editor):
+    # Only claims of the current day matter for the daily limit, older ones can not be repeated anyway
+    Order = apps.get_model('orders', 'Order')
+    HappyHourClaim = apps.get_model('orders', 'HappyHourClaim')
+    recent = Order._default_manager.filter(is_deleted=False, order_date__gte=timezone.now() - timedelta(days=2)).annotate(
+        day=TruncDate('order_date')
+    ).values_list('user_id', 'menu__establishment_id', 'day').distinct()
+    HappyHourClaim.objects.bulk_create([
+        HappyHourClaim(user_id=user_id, establishment_id=establishment_id, day=day)
+        for user_id, establishment_id, day in recent
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('establishments', '0001_initial'),
+        ('orders', '0004_order_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HappyHourClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('establishment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='happy_hour_claims', to='establishments.establishment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='happy_hour_claims', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Happy Hour Claim',
+                'verbose_name_plural': 'Happy Hour Claims',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='happyhourclaim',
+            constraint=models.UniqueConstraint(fields=('user', 'establishment', 'day'), name='unique_daily_happy_hour_claim'),
+        ),
+        migrations.RunPython(backfill_recent_claims, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_establishment_owner(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    Beverage = apps.get_model('menu', 'Beverage')
+    beverages = Beverage._default_manager.filter(id=OuterRef('beverage_id'))
+    Order._default_manager.filter(establishment__isnull=True).update(
+        establishment_id=Subquery(beverages.values('menu__establishment_id')[:1]),
+        owner_id=Subquery(beverages.values('menu__establishment__owner_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('establishments', '0001_initial'),
+        ('menu', '0001_initial'),
+        ('orders', '0005_happyhourclaim'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='establishment',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='establishments.establishment'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='owner',
+            field=models.ForeignKey(blank=True, db_index=False, limit_choices_to={'role': 'partner'}, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='partner_orders', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['owner', 'order_date', 'id'], name='order_owner_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['establishment', 'order_date', 'id'], name='order_est_date_id_idx'),
+        ),
+        migrations.RunPython(backfill_establishment_owner, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:39
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def backfill_prices(apps, schema_editor):
+    # Earlier prices are not known, the current beverage price is the best guess
+    Order = apps.get_model('orders', 'Order')
+    Beverage = apps.get_model('menu', 'Beverage')
+    prices = Beverage._default_manager.filter(id=OuterRef('beverage_id')).values('price')[:1]
+    Order._default_manager.filter(unit_price__isnull=True).update(unit_price=Subquery(prices))
+    Order._default_manager.filter(line_total__isnull=True).update(line_total=F('unit_price') * F('quantity'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0001_initial'),
+        ('orders', '0006_order_establishment_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='line_total',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True),
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('establishments', '0001_initial'),
+        ('menu', '0001_initial'),
+        ('orders', '0007_order_price_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['owner', 'last_updated', 'id'], name='order_owner_updated_id_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL_ESTABLISHMENT_CUSTOMERS = """
+    INSERT INTO orders_establishmentcustomer
+        (establishment_id, customer_id, first_visit, last_visit, order_count, total_spent)
+    SELECT establishment_id, user_id, MIN(order_date), MAX(order_date), COUNT(*), COALESCE(SUM(line_total), 0)
+    FROM orders_order
+    WHERE NOT is_deleted AND establishment_id IS NOT NULL
+    GROUP BY establishment_id, user_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('establishments', '0001_initial'),
+        ('orders', '0008_order_owner_updated_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstablishmentCustomer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_visit', models.DateTimeField()),
+                ('last_visit', models.DateTimeField()),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='establishment_visits', to=settings.AUTH_USER_MODEL)),
+                ('establishment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customers', to='establishments.establishment')),
+            ],
+            options={
+                'verbose_name': 'Establishment Customer',
+                'verbose_name_plural': 'Establishment Customers',
+                'indexes': [models.Index(fields=['establishment', 'last_visit'], name='est_customer_last_visit_idx'), models.Index(fields=['establishment', 'total_spent'], name='est_customer_total_spent_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='establishmentcustomer',
+            constraint=models.UniqueConstraint(fields=('establishment', 'customer'), name='unique_establishment_customer'),
+        ),
+        migrations.RunSQL(BACKFILL_ESTABLISHMENT_CUSTOMERS, migrations.RunSQL.noop),
+    ]
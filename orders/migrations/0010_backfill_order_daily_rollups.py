@@ -0,0 +1,26 @@
+# Generated by Django 5.0.4 on 2026-10-18 09:40
+
+from django.conf import settings
+from django.db import migrations
+
+BACKFILL_ORDER_DAILY_ROLLUPS = """
+    INSERT INTO orders_orderdailyrollup (establishment_id, beverage_id, day, count, revenue)
+    SELECT establishment_id, beverage_id, (order_date AT TIME ZONE %s)::date, COUNT(*), COALESCE(SUM(line_total), 0)
+    FROM orders_order
+    WHERE NOT is_deleted AND establishment_id IS NOT NULL
+    GROUP BY 1, 2, 3
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_establishmentcustomer'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [('DELETE FROM orders_orderdailyrollup', None), (BACKFILL_ORDER_DAILY_ROLLUPS, [settings.TIME_ZONE])],
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -1,38 +1,145 @@
-from datetime import datetime, timedelta
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 
 from dateutil.relativedelta import relativedelta
-from django.db import models
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connections, models, router, transaction
+from django.db.models.functions import Trunc, TruncDate, TruncHour
 from django.utils import timezone
 
 from accounts.models import User
 from core.models import BaseModel
+from establishments.models import Establishment
 from menu.models import Beverage, Menu
 
+# How CounterManager.upsert merges a value into the row that already exists
+MERGE_SQL = {
+    'add': '{table}.{column} + EXCLUDED.{column}',
+    'least': 'LEAST({table}.{column}, EXCLUDED.{column})',
+    'greatest': 'GREATEST({table}.{column}, EXCLUDED.{column})',
+}
+
+
+class CounterManager(models.Manager):
+    '''
+    Manager of aggregate tables that are kept in line with the orders they count.
+    '''
+    def upsert(self, lookup, values):
+        '''
+        Inserts a row in a single INSERT ... ON CONFLICT statement, merging its values into the row that already
+        exists for the lookup fields, which have to be unique together. `values` maps a field to a pair of
+        the value and how it is merged, one of the MERGE_SQL keys.
+        '''
+        opts = self.model._meta
+        connection = connections[router.db_for_write(self.model)]
+        quote = connection.ops.quote_name
+        table = quote(opts.db_table)
+        fields = {opts.get_field(name): value for name, value in lookup.items()}
+        fields.update({opts.get_field(name): value for name, (value, _) in values.items()})
+
+        columns = ', '.join(quote(field.column) for field in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        conflict = ', '.join(quote(opts.get_field(name).column) for name in lookup)
+        merges = ', '.join(
+            '{column} = {merged}'.format(
+                column=quote(opts.get_field(name).column),
+                merged=MERGE_SQL[merge].format(table=table, column=quote(opts.get_field(name).column))
+            ) for name, (_, merge) in values.items()
+        )
+        params = [field.get_db_prep_save(value, connection) for field, value in fields.items()]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES ({placeholders}) '
+                f'ON CONFLICT ({conflict}) DO UPDATE SET {merges}',
+                params
+            )
+
+    def replace(self, stale, rows):
+        '''
+        Swaps the stale rows for freshly computed ones in one transaction. Returns the number of rows written.
+        '''
+        with transaction.atomic():
+            stale.delete()
+            created = self.bulk_create(rows, batch_size=1000)
+        return len(created)
+
 
 class OrderManager(models.Manager):
+    SERIES_GRANULARITIES = ('hour', 'day', 'week', 'month', 'quarter')
+    SERIES_STEPS = {
+        'hour': relativedelta(hours=1),
+        'day': relativedelta(days=1),
+        'week': relativedelta(weeks=1),
+        'month': relativedelta(months=1),
+        'quarter': relativedelta(months=3),
+    }
+
     def for_partner(self, partner, establishment_id=None):
-        queryset = self.filter(menu__establishment__owner=partner)
+        queryset = self.filter(owner=partner)
         if establishment_id:
-            queryset = queryset.filter(menu__establishment__id=establishment_id)
+            queryset = queryset.filter(establishment_id=establishment_id)
         return queryset.select_related('beverage')
 
+    def get_customer_summary(self, partner, customer):
+        '''
+        Visit count, spend, first and last visit and favourite beverage of a customer at the partner's
+        establishments, worked out from a single query grouped by beverage. Every day with orders is one visit.
+        '''
+        rows = list(self.filter(owner=partner, user=customer, is_deleted=False).values(
+            'beverage_id', 'beverage__name'
+        ).annotate(
+            total_count=models.Count('id'),
+            total_sum=models.Sum('line_total'),
+            first_order=models.Min('order_date'),
+            last_order=models.Max('order_date'),
+            visit_days=ArrayAgg(TruncDate('order_date'), distinct=True)
+        ).order_by('-total_count', 'beverage_id'))
+
+        favourite = rows[0] if rows else None
+        return {
+            'visit_count': len(set().union(*(row['visit_days'] for row in rows))),
+            'total_spent': sum(row['total_sum'] or 0 for row in rows),
+            'first_visit': min((row['first_order'] for row in rows), default=None),
+            'last_visit': max((row['last_order'] for row in rows), default=None),
+            'favourite_beverage': favourite and {
+                'id': favourite['beverage_id'],
+                'name': favourite['beverage__name'],
+                'order_count': favourite['total_count'],
+            },
+        }
+
+    def get_daily_totals(self, partner, start_date, end_date, establishment_id=None):
+        '''
+        Returns order counts and price sums grouped by local day for the whole range in a single query
+        over the daily rollup table. Days without orders are left out, callers zero-fill them.
+        '''
+        first_day = timezone.localtime(start_date).date()
+        last_day = timezone.localtime(end_date).date()
+        rollups = OrderDailyRollup.objects.filter(establishment__owner=partner, day__range=(first_day, last_day))
+        if establishment_id:
+            rollups = rollups.filter(establishment_id=establishment_id)
+        rows = rollups.values('day').annotate(
+            total_count=models.Sum('count'),
+            total_sum=models.Sum('revenue')
+        ).order_by()
+
+        return {row['day']: {'count': row['total_count'], 'sum': row['total_sum'] or 0} for row in rows}
+
     def get_stats_by_day(self, partner, start_date, end_date, establishment_id=None):
+        daily_totals = self.get_daily_totals(partner, start_date, end_date, establishment_id)
         orders_by_day = {}
         current_day = start_date
 
         while current_day <= end_date:
-            orders = self.for_partner(partner, establishment_id).filter(order_date__date=current_day)
-            orders_total_count = orders.count()
-            orders_total_sum = orders.aggregate(total_sum=models.Sum('beverage__price'))['total_sum'] or 0
-            orders_by_day[current_day.strftime('%a-%Y-%m-%d')] = {
-                'count': orders_total_count,
-                'sum': orders_total_sum
-            }
+            orders_by_day[current_day.strftime('%a-%Y-%m-%d')] = self._sum_daily_totals(
+                daily_totals, current_day, current_day
+            )
             current_day += timedelta(days=1)
 
         return orders_by_day
 
     def get_stats_by_week(self, partner, start_date, end_date, establishment_id=None):
+        daily_totals = self.get_daily_totals(partner, start_date, end_date, establishment_id)
         orders_by_week = {}
         current_week_start = start_date
 
@@ -40,23 +147,17 @@ class OrderManager(models.Manager):
             current_week_end = current_week_start + timedelta(days=6)
             if current_week_end > end_date:
                 current_week_end = end_date
-            week_orders = self.for_partner(partner, establishment_id).filter(
-                order_date__date__range=[current_week_start, current_week_end])
-            week_orders_count = week_orders.count()
-            week_orders_sum = week_orders.aggregate(total_sum=models.Sum('beverage__price'))['total_sum'] or 0
             orders_by_week[
                 (str(current_week_start.strftime('%a-%Y-%m-%d')) + ' - ' +  # noqa: W504
                  str(current_week_end.strftime('%a-%Y-%m-%d')))
-            ] = {
-                'count': week_orders_count,
-                'sum': week_orders_sum
-            }
+            ] = self._sum_daily_totals(daily_totals, current_week_start, current_week_end)
 
             current_week_start += timedelta(days=7)
 
         return orders_by_week
 
     def get_stats_by_month(self, partner, start_date, end_date, establishment_id=None):
+        daily_totals = self.get_daily_totals(partner, start_date, end_date, establishment_id)
         orders_by_month = {}
         current_month_start = start_date
 
@@ -64,13 +165,9 @@ class OrderManager(models.Manager):
             current_month_end = (current_month_start + relativedelta(months=1)).replace(day=1) - timedelta(days=1)
             if current_month_end > end_date:
                 current_month_end = end_date
-            month_data = self.get_stats_by_week(partner, current_month_start, current_month_end, establishment_id)
-            month_count = sum(week_data['count'] for week_data in month_data.values())
-            month_sum = sum(week_data['sum'] for week_data in month_data.values())
-            orders_by_month[current_month_start.strftime('%Y-%m')] = {
-                'count': month_count,
-                'sum': month_sum
-            }
+            orders_by_month[current_month_start.strftime('%Y-%m')] = self._sum_daily_totals(
+                daily_totals, current_month_start, current_month_end
+            )
             current_month_start += relativedelta(months=1)
 
         return orders_by_month
@@ -78,21 +175,16 @@ class OrderManager(models.Manager):
     def get_stats_by_quarter(self, partner, start_date, end_date, establishment_id=None):
         orders_by_quarter = {}
         current_quarter_start = self.get_start_of_quarter(start_date)
+        daily_totals = self.get_daily_totals(partner, current_quarter_start, end_date, establishment_id)
 
         while current_quarter_start <= end_date:
             current_quarter_end = current_quarter_start + relativedelta(months=3, days=-1)
             if current_quarter_end > end_date:
                 current_quarter_end = end_date
-            quarter_data = self.get_stats_by_month(
-                partner, current_quarter_start, current_quarter_end, establishment_id
-            )
-            quarter_count = sum(month_data['count'] for month_data in quarter_data.values())
-            quarter_sum = sum(month_data['sum'] for month_data in quarter_data.values())
             quarter_label = f'Q{(current_quarter_start.month - 1) // 3 + 1}_{current_quarter_start.year}'
-            orders_by_quarter[quarter_label] = {
-                'count': quarter_count,
-                'sum': quarter_sum
-            }
+            orders_by_quarter[quarter_label] = self._sum_daily_totals(
+                daily_totals, current_quarter_start, current_quarter_end
+            )
             current_quarter_start += relativedelta(months=3)
 
         return orders_by_quarter
@@ -101,6 +193,149 @@ class OrderManager(models.Manager):
         quarter_month = (date.month - 1) // 3 * 3 + 1
         return datetime(date.year, quarter_month, 1, tzinfo=date.tzinfo)
 
+    def get_series_periods(self, start_day, end_day, granularity):
+        '''
+        Returns the start of every bucket of the given granularity between two dates, both inclusive.
+        Hourly buckets are aware datetimes, the others are dates aligned like Postgres date_trunc.
+        '''
+        if granularity == 'hour':
+            current = timezone.make_aware(datetime.combine(start_day, time.min))
+            last = timezone.make_aware(datetime.combine(end_day, time.max))
+        elif granularity == 'week':
+            current, last = start_day - timedelta(days=start_day.weekday()), end_day
+        elif granularity == 'month':
+            current, last = start_day.replace(day=1), end_day
+        elif granularity == 'quarter':
+            current, last = start_day.replace(month=(start_day.month - 1) // 3 * 3 + 1, day=1), end_day
+        else:
+            current, last = start_day, end_day
+
+        periods = []
+        while current <= last:
+            periods.append(current)
+            current += self.SERIES_STEPS[granularity]
+        return periods
+
+    def count_series_periods(self, start_day, end_day, granularity):
+        if granularity == 'hour':
+            return ((end_day - start_day).days + 1) * 24
+        if granularity == 'week':
+            return (end_day - start_day + timedelta(days=start_day.weekday())).days // 7 + 1
+        if granularity == 'month':
+            return (end_day.year - start_day.year) * 12 + end_day.month - start_day.month + 1
+        if granularity == 'quarter':
+            return (end_day.year - start_day.year) * 4 + (end_day.month - 1) // 3 - (start_day.month - 1) // 3 + 1
+        return (end_day - start_day).days + 1
+
+    def get_series(self, partner, start_day, end_day, granularity, establishment_id=None, beverage_id=None):
+        '''
+        Returns zero-filled order counts and sums of a single series, computed with one grouped query.
+        Hourly buckets are read from the orders table, the coarser ones from the daily rollup.
+        '''
+        if granularity == 'hour':
+            queryset = self.for_partner(partner, establishment_id).filter(
+                is_deleted=False,
+                order_date__gte=timezone.make_aware(datetime.combine(start_day, time.min)),
+                order_date__lt=timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time.min))
+            )
+            if beverage_id:
+                queryset = queryset.filter(beverage_id=beverage_id)
+            rows = queryset.annotate(period=TruncHour('order_date')).values('period').annotate(
+                total_count=models.Count('id'),
+                total_sum=models.Sum('line_total')
+            ).order_by()
+        else:
+            queryset = OrderDailyRollup.objects.filter(establishment__owner=partner, day__range=(start_day, end_day))
+            if establishment_id:
+                queryset = queryset.filter(establishment_id=establishment_id)
+            if beverage_id:
+                queryset = queryset.filter(beverage_id=beverage_id)
+            rows = queryset.annotate(period=Trunc('day', granularity)).values('period').annotate(
+                total_count=models.Sum('count'),
+                total_sum=models.Sum('revenue')
+            ).order_by()
+
+        totals = {row['period']: row for row in rows}
+        series = []
+        for period in self.get_series_periods(start_day, end_day, granularity):
+            row = totals.get(period)
+            series.append({
+                'period': period,
+                'count': row['total_count'] if row else 0,
+                'sum': (row['total_sum'] or 0) if row else 0
+            })
+        return series
+
+    def _sum_daily_totals(self, daily_totals, start_date, end_date):
+        '''
+        Folds the grouped daily rows into one bucket covering the local days from start_date to end_date.
+        '''
+        bucket = {'count': 0, 'sum': 0}
+        current_day = timezone.localtime(start_date).date()
+        last_day = timezone.localtime(end_date).date()
+
+        while current_day <= last_day:
+            day_totals = daily_totals.get(current_day)
+            if day_totals:
+                bucket['count'] += day_totals['count']
+                bucket['sum'] += day_totals['sum']
+            current_day += timedelta(days=1)
+
+        return bucket
+
+
+class OrderDailyRollupManager(CounterManager):
+    def add(self, establishment_id, beverage_id, day, count, revenue):
+        '''
+        Shifts the counters of one (establishment, beverage, day) row, creating the row on first use.
+        '''
+        lookup = {'establishment_id': establishment_id, 'beverage_id': beverage_id, 'day': day}
+        if count < 0:
+            # Removals always find their row unless it went away with its establishment or beverage
+            self.filter(**lookup).update(count=models.F('count') + count, revenue=models.F('revenue') + revenue)
+            return
+        self.upsert(lookup, {'count': (count, 'add'), 'revenue': (revenue, 'add')})
+
+    def add_orders(self, orders):
+        '''
+        Counts freshly inserted orders in, for inserts that bypass the save signals.
+        '''
+        buckets = defaultdict(lambda: [0, 0])
+        for order in orders:
+            key = (order.establishment_id, order.beverage_id, timezone.localtime(order.order_date).date())
+            buckets[key][0] += 1
+            buckets[key][1] += order.line_total
+        for (establishment_id, beverage_id, day), (count, revenue) in buckets.items():
+            self.add(establishment_id, beverage_id, day, count, revenue)
+
+    def rebuild(self, establishment_id=None):
+        '''
+        Recomputes rollup rows from the orders table, used to backfill existing orders.
+        Returns the number of rows written.
+        '''
+        orders = Order.objects.all()
+        rollups = self.all()
+        if establishment_id:
+            orders = orders.filter(establishment_id=establishment_id)
+            rollups = rollups.filter(establishment_id=establishment_id)
+
+        rows = orders.annotate(
+            day=TruncDate('order_date')
+        ).values('establishment_id', 'beverage_id', 'day').annotate(
+            total_count=models.Count('id'),
+            total_sum=models.Sum('line_total')
+        ).order_by()
+
+        return self.replace(rollups, [
+            self.model(
+                establishment_id=row['establishment_id'],
+                beverage_id=row['beverage_id'],
+                day=row['day'],
+                count=row['total_count'],
+                revenue=row['total_sum'] or 0
+            ) for row in rows
+        ])
+
 
 class Order(BaseModel):
     ORDER_STATUS_CHOICES = [
@@ -108,20 +343,226 @@ class Order(BaseModel):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     ]
+    # Statuses an order may move to from its current one, completed and cancelled orders are final
+    STATUS_TRANSITIONS = {
+        'pending': ('completed', 'cancelled'),
+        'completed': (),
+        'cancelled': (),
+    }
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     menu = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name='orders')
     beverage = models.ForeignKey(Beverage, on_delete=models.CASCADE, related_name='orders')
+    # Denormalized from the beverage's menu so partner queries do not have to join through it
+    establishment = models.ForeignKey(
+        Establishment, on_delete=models.CASCADE, related_name='orders', null=True, blank=True, db_index=False
+    )
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, limit_choices_to={'role': 'partner'},
+        related_name='partner_orders', null=True, blank=True, db_index=False
+    )
     order_date = models.DateTimeField(default=timezone.now)
     status = models.CharField(max_length=10, choices=ORDER_STATUS_CHOICES, default='pending')
     quantity = models.PositiveIntegerField(default=1)
+    # What was actually charged, kept apart from later beverage price changes
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     last_updated = models.DateTimeField(auto_now=True)
 
     statistics = OrderManager()
 
+    # Fields whose loaded values are kept to work out what changed on save
+    TRACKED_FIELDS = ('establishment_id', 'beverage_id', 'order_date', 'is_deleted', 'line_total', 'status')
+
     class Meta:
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
+        indexes = [
+            # Keyset pagination over (order_date, id)
+            models.Index(fields=['order_date', 'id'], name='order_date_id_idx'),
+            models.Index(fields=['user', 'order_date', 'id'], name='order_user_date_id_idx'),
+            models.Index(fields=['owner', 'order_date', 'id'], name='order_owner_date_id_idx'),
+            models.Index(fields=['establishment', 'order_date', 'id'], name='order_est_date_id_idx'),
+            # Partner order event stream over (last_updated, id)
+            models.Index(fields=['owner', 'last_updated', 'id'], name='order_owner_updated_id_idx'),
+        ]
 
     def __str__(self):
         return f'Order {self.pk} by {self.user.email} at {self.menu.establishment.name} - {self.beverage.name}'
+
+    def save(self, *args, **kwargs):
+        if self.establishment_id is None:
+            self.establishment = self.beverage.menu.establishment
+        if self.owner_id is None:
+            self.owner_id = self.establishment.owner_id
+        if self.unit_price is None:
+            self.unit_price = self.beverage.price
+        self.line_total = self.unit_price * self.quantity
+        super().save(*args, **kwargs)
+        # post_save receivers compare against the values from before this save
+        self.remember_tracked_values()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_tracked_values()
+        return instance
+
+    def get_tracked_values(self):
+        return {field: self.__dict__[field] for field in self.TRACKED_FIELDS if field in self.__dict__}
+
+    def remember_tracked_values(self):
+        self._loaded_values = self.get_tracked_values()
+
+
+class OrderDailyRollup(models.Model):
+    '''
+    Per day order count and revenue of a beverage at an establishment, kept up to date on order saves
+    so that partner statistics never have to scan the orders table. Counts every order that is not soft-deleted,
+    whatever its status.
+    '''
+    establishment = models.ForeignKey(Establishment, on_delete=models.CASCADE, related_name='order_rollups')
+    beverage = models.ForeignKey(Beverage, on_delete=models.CASCADE, related_name='order_rollups')
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = OrderDailyRollupManager()
+
+    class Meta:
+        verbose_name = 'Order Daily Rollup'
+        verbose_name_plural = 'Order Daily Rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['establishment', 'beverage', 'day'], name='unique_order_daily_rollup')
+        ]
+        indexes = [
+            models.Index(fields=['establishment', 'day'], name='order_rollup_establishment_day')
+        ]
+
+    def __str__(self):
+        return f'{self.day} - establishment {self.establishment_id}, beverage {self.beverage_id}: {self.count}'
+
+
+class EstablishmentCustomerManager(CounterManager):
+    def add(self, establishment_id, customer_id, first_visit, last_visit, count, spend):
+        '''
+        Counts orders of a customer in, creating the row on the customer's first visit.
+        '''
+        self.upsert({'establishment_id': establishment_id, 'customer_id': customer_id}, {
+            'first_visit': (first_visit, 'least'),
+            'last_visit': (last_visit, 'greatest'),
+            'order_count': (count, 'add'),
+            'total_spent': (spend, 'add'),
+        })
+
+    def add_orders(self, orders):
+        '''
+        Counts freshly inserted orders in, for inserts that bypass the save signals.
+        '''
+        visits = defaultdict(list)
+        for order in orders:
+            visits[(order.establishment_id, order.user_id)].append(order)
+        for (establishment_id, customer_id), customer_orders in visits.items():
+            order_dates = [order.order_date for order in customer_orders]
+            self.add(
+                establishment_id, customer_id, min(order_dates), max(order_dates),
+                len(customer_orders), sum(order.line_total for order in customer_orders)
+            )
+
+    def get_visit_rows(self, orders):
+        '''
+        Visit history per establishment and customer of the given orders, soft-deleted ones never count.
+        '''
+        orders = orders.filter(is_deleted=False).exclude(establishment=None)
+        return orders.values('establishment_id', 'user_id').annotate(
+            first_order=models.Min('order_date'),
+            last_order=models.Max('order_date'),
+            total_count=models.Count('id'),
+            total_sum=models.Sum('line_total')
+        ).order_by()
+
+    def refresh(self, establishment_id, customer_id):
+        '''
+        Recomputes the row of one customer from their orders, for orders that were soft-deleted, restored,
+        moved, re-dated, re-priced or deleted, which cannot be counted out incrementally.
+        '''
+        rows = list(self.get_visit_rows(Order.everything.filter(establishment_id=establishment_id, user_id=customer_id)))
+        lookup = {'establishment_id': establishment_id, 'customer_id': customer_id}
+        if not rows:
+            self.filter(**lookup).delete()
+            return
+        row = rows[0]
+        self.update_or_create(defaults={
+            'first_visit': row['first_order'],
+            'last_visit': row['last_order'],
+            'order_count': row['total_count'],
+            'total_spent': row['total_sum'] or 0,
+        }, **lookup)
+
+    def rebuild(self):
+        '''
+        Recomputes every row from the orders table, used to backfill existing orders.
+        Returns the number of rows written.
+        '''
+        rows = self.get_visit_rows(Order.everything.all())
+
+        return self.replace(self.all(), [
+            self.model(
+                establishment_id=row['establishment_id'],
+                customer_id=row['user_id'],
+                first_visit=row['first_order'],
+                last_visit=row['last_order'],
+                order_count=row['total_count'],
+                total_spent=row['total_sum'] or 0
+            ) for row in rows
+        ])
+
+
+class EstablishmentCustomer(models.Model):
+    '''
+    Per establishment visit history of a customer, kept up to date on order creation
+    so that partners can list and sort their customers without scanning the orders table.
+    '''
+    establishment = models.ForeignKey(Establishment, on_delete=models.CASCADE, related_name='customers')
+    customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='establishment_visits')
+    first_visit = models.DateTimeField()
+    last_visit = models.DateTimeField()
+    order_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = EstablishmentCustomerManager()
+
+    class Meta:
+        verbose_name = 'Establishment Customer'
+        verbose_name_plural = 'Establishment Customers'
+        constraints = [
+            models.UniqueConstraint(fields=['establishment', 'customer'], name='unique_establishment_customer')
+        ]
+        indexes = [
+            models.Index(fields=['establishment', 'last_visit'], name='est_customer_last_visit_idx'),
+            models.Index(fields=['establishment', 'total_spent'], name='est_customer_total_spent_idx'),
+        ]
+
+    def __str__(self):
+        return f'Customer {self.customer_id} at establishment {self.establishment_id}: {self.order_count} orders'
+
+
+class HappyHourClaim(models.Model):
+    '''
+    Ledger of free beverages claimed during happy hour, the unique constraint makes
+    "one claim per customer, establishment and local day" an atomic insert-or-fail.
+    '''
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='happy_hour_claims')
+    establishment = models.ForeignKey(Establishment, on_delete=models.CASCADE, related_name='happy_hour_claims')
+    day = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Happy Hour Claim'
+        verbose_name_plural = 'Happy Hour Claims'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'establishment', 'day'], name='unique_daily_happy_hour_claim')
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} at establishment {self.establishment_id} on {self.day}'
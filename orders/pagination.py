@@ -0,0 +1,120 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class OrderListPagination(LimitOffsetPagination):
+    '''
+    Limit/offset pagination that switches to keyset pagination over (order_date, id) when
+    `pagination=cursor` or a `cursor` is passed. A keyset page costs the same however deep it is
+    and does not shift when new orders are inserted.
+    '''
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_requested = request.query_params.get(self.mode_query_param) == 'cursor'
+        self.use_cursor = cursor_requested or self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        position, reverse = self.decode_cursor(request)
+
+        if reverse:
+            queryset = queryset.order_by('order_date', 'id')
+        else:
+            queryset = queryset.order_by('-order_date', '-id')
+        if position:
+            order_date, order_id = position
+            if reverse:
+                queryset = queryset.filter(order_date__gte=order_date).filter(
+                    Q(order_date__gt=order_date) | Q(id__gt=order_id)
+                )
+            else:
+                queryset = queryset.filter(order_date__lte=order_date).filter(
+                    Q(order_date__lt=order_date) | Q(id__lt=order_id)
+                )
+
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        page = results[:self.limit]
+
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = page
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.use_cursor:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            order_date, order_id, reverse = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            order_date = parse_datetime(order_date)
+            if order_date is None:
+                raise ValueError
+            return (order_date, int(order_id)), bool(reverse)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, order, reverse):
+        cursor = json.dumps([order.order_date.isoformat(), order.id, int(reverse)])
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, urlsafe_b64encode(cursor.encode()).decode('ascii'))
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters += [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Pass `cursor` to page through results with cursors instead of offsets.',
+                'schema': {'type': 'string', 'enum': ['cursor']},
+            },
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value returned in `next` or `previous` links.',
+                'schema': {'type': 'string'},
+            },
+        ]
+        return parameters
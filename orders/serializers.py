@@ -1,3 +1,7 @@
+from collections import Counter
+from functools import partial
+
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import exceptions, serializers
@@ -5,8 +9,24 @@ from rest_framework import exceptions, serializers
 from accounts.models import User
 from menu.models import Beverage, Menu
 from subscriptions.models import UserSubscription
+from subscriptions.utils import NO_SUBSCRIPTION, get_subscription_status
+
+from .events import order_events
+from .models import EstablishmentCustomer, HappyHourClaim, Order, OrderDailyRollup
+from .utils import invalidate_partner_stats
+
+
+def get_violated_constraint(error):
+    '''
+    Name of the constraint an IntegrityError was raised for, as reported by the database driver
+    '''
+    return getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None)
+
 
-from .models import Order
+class OrderStatusConflict(exceptions.APIException):
+    status_code = 409
+    default_detail = 'The order status was changed by someone else, reload the order and try again.'
+    default_code = 'conflict'
 
 
 class CustomerOrderSerializer(serializers.ModelSerializer):
@@ -14,7 +34,7 @@ class CustomerOrderSerializer(serializers.ModelSerializer):
     For customers to create and view their orders
     '''
     beverage_id = serializers.IntegerField(write_only=True)
-    establishment_name = serializers.CharField(source='menu.establishment.name', read_only=True)
+    establishment_name = serializers.CharField(source='establishment.name', read_only=True)
     beverage_name = serializers.CharField(source='beverage.name', read_only=True)
 
     class Meta:
@@ -56,48 +76,57 @@ class CustomerOrderSerializer(serializers.ModelSerializer):
         if beverage_id is None:
             raise serializers.ValidationError({'error': 'Beverage ID is required.'})
 
+        # Beverage, menu and establishment in a single query
         try:
-            beverage = Beverage.objects.get(id=beverage_id)
-            menu = Menu.objects.get(id=beverage.menu.id)
-            establishment = menu.establishment
-
-            # Check if the user has an active subscription
-            subscription = UserSubscription.objects.get(user=user)
-            if subscription.status != 'ACTIVE':
-                raise exceptions.PermissionDenied('Your subscription is not active. Please renew your subscription.')
-        except UserSubscription.DoesNotExist:
-            raise exceptions.PermissionDenied('No subscription found. Please subscribe to use this service.')
-
+            beverage = Beverage.objects.select_related('menu__establishment').get(id=beverage_id)
         except Beverage.DoesNotExist:
             raise serializers.ValidationError({'error': 'Beverage with given ID does not exist.'})
-        except Menu.DoesNotExist:
+        menu = beverage.menu
+        establishment = menu.establishment
+
+        # Check if the user has an active subscription
+        subscription_status = get_subscription_status(user)
+        if subscription_status == NO_SUBSCRIPTION:
+            raise exceptions.PermissionDenied('No subscription found. Please subscribe to use this service.')
+        if subscription_status != UserSubscription.ACTIVE:
+            raise exceptions.PermissionDenied('Your subscription is not active. Please renew your subscription.')
+        if menu.is_deleted:
             raise serializers.ValidationError({'error': 'Menu for the given beverage does not exist.'})
 
         happy_hour_start = establishment.happy_hour_start
         happy_hour_end = establishment.happy_hour_end
 
-        if self.is_within_happy_hour(happy_hour_start, happy_hour_end, current_time_only):
-            # Check if the user has already ordered a free beverage at this establishment during the day
-            if Order.objects.filter(
-                user=user,
-                menu=menu,
-                order_date__date=current_time.date()
-            ).exists():
-                raise serializers.ValidationError(
-                    {'error': 'You have already claimed a free beverage at this establishment today.'}
-                )
-        else:
+        if not self.is_within_happy_hour(happy_hour_start, happy_hour_end, current_time_only):
             raise serializers.ValidationError(
                 {'error': f'It is not happy hour currently. '
                  f'Please order within establishment happy hours: {happy_hour_start} to {happy_hour_end}'}
             )
 
-        order = Order.objects.create(
-            beverage=beverage,
-            user=user,
-            menu=menu,
-            status='pending'
-        )
+        # Stock is taken by its own statement so the beverage row is not kept locked while the order is written
+        if not Beverage.objects.reserve_stock(beverage.id, 1):
+            raise serializers.ValidationError({'error': 'Beverage is out of stock.'})
+        try:
+            with transaction.atomic():
+                # The claim ledger rejects a second free beverage at this establishment during the day
+                HappyHourClaim.objects.create(user=user, establishment=establishment, day=current_time.date())
+                order = Order.objects.create(
+                    beverage=beverage,
+                    user=user,
+                    menu=menu,
+                    establishment=establishment,
+                    owner_id=establishment.owner_id,
+                    status='pending'
+                )
+        except IntegrityError as e:
+            Beverage.objects.release_stock(beverage.id, 1)
+            if get_violated_constraint(e) != 'unique_daily_happy_hour_claim':
+                raise
+            raise serializers.ValidationError(
+                {'error': 'You have already claimed a free beverage at this establishment today.'}
+            )
+        except Exception:
+            Beverage.objects.release_stock(beverage.id, 1)
+            raise
 
         return order
 
@@ -108,7 +137,7 @@ class PartnersCreateOrderSerializer(serializers.ModelSerializer):
     '''
     beverage_id = serializers.IntegerField(write_only=True)
     customer_id = serializers.IntegerField(write_only=True)
-    establishment_name = serializers.CharField(source='menu.establishment.name', read_only=True)
+    establishment_name = serializers.CharField(source='establishment.name', read_only=True)
     beverage_name = serializers.CharField(source='beverage.name', read_only=True)
 
     class Meta:
@@ -144,22 +173,137 @@ class PartnersCreateOrderSerializer(serializers.ModelSerializer):
         try:
             beverage = Beverage.objects.get(id=beverage_id)
             menu = Menu.objects.get(id=beverage.menu.id)
+            establishment = menu.establishment
             customer = User.objects.get(id=customer_id, role='customer')
         except Beverage.DoesNotExist:
             raise serializers.ValidationError({'error': 'Beverage with given ID does not exist.'})
         except User.DoesNotExist:
             raise serializers.ValidationError({'error': 'Customer with given ID does not exist.'})
 
-        order = Order.objects.create(
-            beverage=beverage,
-            user=customer,
-            menu=menu,
-            status='pending'
-        )
+        if not Beverage.objects.reserve_stock(beverage.id, 1):
+            raise serializers.ValidationError({'error': 'Beverage is out of stock.'})
+        try:
+            order = Order.objects.create(
+                beverage=beverage,
+                user=customer,
+                menu=menu,
+                establishment=establishment,
+                owner_id=establishment.owner_id,
+                status='pending'
+            )
+        except Exception:
+            Beverage.objects.release_stock(beverage.id, 1)
+            raise
 
         return order
 
 
+class PartnersBulkCreateOrderListSerializer(serializers.ListSerializer):
+    MAX_ORDERS = 100
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('allow_empty', False)
+        kwargs.setdefault('max_length', self.MAX_ORDERS)
+        super().__init__(*args, **kwargs)
+
+    def create(self, validated_data):
+        partner = self.context['request'].user
+        beverages = Beverage.objects.filter(menu__establishment__owner=partner).select_related(
+            'menu__establishment'
+        ).in_bulk({item['beverage_id'] for item in validated_data})
+        customers = User.objects.filter(role='customer').in_bulk({item['customer_id'] for item in validated_data})
+
+        missing_beverages = sorted({item['beverage_id'] for item in validated_data} - beverages.keys())
+        if missing_beverages:
+            raise serializers.ValidationError(
+                {'error': f'Beverages with given IDs do not exist: {", ".join(map(str, missing_beverages))}.'}
+            )
+        missing_customers = sorted({item['customer_id'] for item in validated_data} - customers.keys())
+        if missing_customers:
+            raise serializers.ValidationError(
+                {'error': f'Customers with given IDs do not exist: {", ".join(map(str, missing_customers))}.'}
+            )
+
+        orders = []
+        for item in validated_data:
+            beverage = beverages[item['beverage_id']]
+            orders.append(Order(
+                beverage=beverage,
+                user=customers[item['customer_id']],
+                menu=beverage.menu,
+                establishment=beverage.menu.establishment,
+                owner=partner,
+                quantity=item['quantity'],
+                unit_price=beverage.price,
+                line_total=beverage.price * item['quantity'],
+                status='pending'
+            ))
+
+        quantities = Counter()
+        for order in orders:
+            quantities[order.beverage_id] += order.quantity
+        reserved = {}
+        try:
+            for beverage_id, quantity in sorted(quantities.items()):
+                if not Beverage.objects.reserve_stock(beverage_id, quantity):
+                    raise serializers.ValidationError(
+                        {'error': f'Beverage with ID {beverage_id} does not have {quantity} in stock.'}
+                    )
+                reserved[beverage_id] = quantity
+
+            # bulk_create skips save signals, so rollups, customers, cached stats and order streams are updated here
+            with transaction.atomic():
+                orders = Order.objects.bulk_create(orders)
+                OrderDailyRollup.objects.add_orders(orders)
+                EstablishmentCustomer.objects.add_orders(orders)
+                transaction.on_commit(partial(order_events.publish, partner.id))
+        except Exception:
+            for beverage_id, quantity in reserved.items():
+                Beverage.objects.release_stock(beverage_id, quantity)
+            raise
+        invalidate_partner_stats(partner.id)
+
+        return orders
+
+
+class PartnersBulkCreateOrderSerializer(serializers.ModelSerializer):
+    '''
+    Allow partners to create many orders for customers at once, e.g. for a group tab
+    '''
+    beverage_id = serializers.IntegerField(write_only=True)
+    customer_id = serializers.IntegerField(write_only=True)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+    establishment_name = serializers.CharField(source='establishment.name', read_only=True)
+    beverage_name = serializers.CharField(source='beverage.name', read_only=True)
+
+    class Meta:
+        model = Order
+        list_serializer_class = PartnersBulkCreateOrderListSerializer
+        fields = [
+            'id',
+            'establishment_name',
+            'beverage_id',
+            'customer_id',
+            'beverage_name',
+            'order_date',
+            'status',
+            'quantity',
+            'unit_price',
+            'line_total',
+            'last_updated'
+        ]
+        read_only_fields = [
+            'id',
+            'establishment_name',
+            'beverage_name',
+            'order_date',
+            'status',
+            'unit_price',
+            'line_total',
+            'last_updated',
+        ]
+
+
 class PartnersDetailOrderSerializer(serializers.ModelSerializer):
     '''
     Allow partners to view and update order details
@@ -167,9 +311,9 @@ class PartnersDetailOrderSerializer(serializers.ModelSerializer):
     user_email = serializers.EmailField(source='user.email', read_only=True)
     user_first_name = serializers.CharField(source='user.first_name', read_only=True)
     user_last_name = serializers.CharField(source='user.last_name', read_only=True)
-    establishment_name = serializers.CharField(source='menu.establishment.name', read_only=True)
+    establishment_name = serializers.CharField(source='establishment.name', read_only=True)
     beverage_name = serializers.CharField(source='beverage.name', read_only=True)
-    beverage_price = serializers.DecimalField(source='beverage.price', max_digits=10, decimal_places=2, read_only=True)
+    beverage_price = serializers.DecimalField(source='unit_price', max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = Order
@@ -184,6 +328,7 @@ class PartnersDetailOrderSerializer(serializers.ModelSerializer):
             'order_date',
             'status',
             'quantity',
+            'line_total',
             'last_updated'
         ]
         read_only_fields = [
@@ -196,9 +341,42 @@ class PartnersDetailOrderSerializer(serializers.ModelSerializer):
             'beverage_price',
             'order_date',
             'quantity',
+            'line_total',
             'last_updated'
         ]
 
+    def validate_status(self, value):
+        current = self.instance.status if self.instance else None
+        if current and value != current and value not in Order.STATUS_TRANSITIONS[current]:
+            raise serializers.ValidationError(f'Order status can not change from {current} to {value}.')
+        return value
+
+    def update(self, instance, validated_data):
+        '''
+        Changes the status with a single conditional UPDATE that only applies while the order still has
+        the status it was read with, so that concurrent changes of the same order do not overwrite each other.
+        '''
+        new_status = validated_data.get('status', instance.status)
+        if new_status == instance.status:
+            return instance
+
+        last_updated = timezone.now()
+        with transaction.atomic():
+            updated = Order.objects.filter(id=instance.id, status=instance.status).update(
+                status=new_status, last_updated=last_updated
+            )
+            if not updated:
+                raise OrderStatusConflict()
+            if new_status == 'cancelled':
+                # Cancelled orders give their stock back
+                Beverage.objects.release_stock(instance.beverage_id, instance.quantity)
+            # The update skips post_save, so open order streams are woken up here
+            transaction.on_commit(partial(order_events.publish, instance.owner_id))
+
+        instance.status, instance.last_updated = new_status, last_updated
+        instance.remember_tracked_values()
+        return instance
+
 
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -206,23 +384,54 @@ class CustomerSerializer(serializers.ModelSerializer):
         fields = ['id', 'first_name', 'last_name', 'email', 'sex', 'date_of_birth', ]
 
 
+class PartnerCustomerSerializer(CustomerSerializer):
+    '''
+    Customer of the partner's establishments along with their visit history there
+    '''
+    first_visit = serializers.DateTimeField(read_only=True)
+    last_visit = serializers.DateTimeField(read_only=True)
+    order_count = serializers.IntegerField(read_only=True)
+    total_spent = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+
+    class Meta(CustomerSerializer.Meta):
+        fields = CustomerSerializer.Meta.fields + ['first_visit', 'last_visit', 'order_count', 'total_spent']
+
+
 class FindCustomerByEmailSerializer(serializers.Serializer):
     email = serializers.EmailField()
 
 
 class OrderHistorySerializer(serializers.ModelSerializer):
     beverage_name = serializers.CharField(source='beverage.name', read_only=True)
-    price = serializers.DecimalField(source='beverage.price', max_digits=10, decimal_places=2, read_only=True)
+    price = serializers.DecimalField(source='unit_price', max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = Order
         fields = ['id', 'order_date', 'beverage_name', 'price']
 
 
+class FavouriteBeverageSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    order_count = serializers.IntegerField()
+
+
+class CustomerOrderSummarySerializer(serializers.Serializer):
+    visit_count = serializers.IntegerField()
+    total_spent = serializers.DecimalField(max_digits=14, decimal_places=2)
+    first_visit = serializers.DateTimeField(allow_null=True)
+    last_visit = serializers.DateTimeField(allow_null=True)
+    favourite_beverage = FavouriteBeverageSerializer(allow_null=True)
+
+
 class DetailedCustomerProfileSerializer(serializers.ModelSerializer):
     '''
     This serializer nests the OrderHistorySerializer to include order details specific to the partner’s establishment.
+    Only the most recent orders are included, the full history is paginated by its own endpoint.
     '''
+    RECENT_ORDERS = 10
+
+    summary = serializers.SerializerMethodField()
     orders = serializers.SerializerMethodField()
 
     class Meta:
@@ -234,15 +443,74 @@ class DetailedCustomerProfileSerializer(serializers.ModelSerializer):
             'email',
             'sex',
             'date_of_birth',
+            'summary',
             'orders'
         ]
 
+    @extend_schema_field(CustomerOrderSummarySerializer)
+    def get_summary(self, obj):
+        user = self.context['request'].user
+        return CustomerOrderSummarySerializer(Order.statistics.get_customer_summary(user, obj)).data
+
     @extend_schema_field(OrderHistorySerializer(many=True))
     def get_orders(self, obj):
         request = self.context.get('request')
         user = request.user
-        orders = Order.objects.filter(beverage__menu__establishment__owner=user, user=obj)
-        return OrderHistorySerializer(orders, many=True).data
+        orders = Order.objects.filter(owner=user, user=obj).select_related('beverage').order_by('-order_date', '-id')
+        return OrderHistorySerializer(orders[:self.RECENT_ORDERS], many=True).data
+
+
+class BulkOrderStatusResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    result = serializers.ChoiceField(choices=['updated', 'unchanged', 'not_found', 'not_allowed'])
+
+
+class BulkOrderStatusSerializer(serializers.Serializer):
+    '''
+    For partners to set the status of many orders of their establishments at once
+    '''
+    MAX_ORDERS = 200
+
+    order_ids = serializers.ListField(
+        child=serializers.IntegerField(), min_length=1, max_length=MAX_ORDERS, write_only=True
+    )
+    status = serializers.ChoiceField(choices=Order.ORDER_STATUS_CHOICES)
+    results = BulkOrderStatusResultSerializer(many=True, read_only=True)
+
+    def create(self, validated_data):
+        partner = self.context['request'].user
+        order_ids = list(dict.fromkeys(validated_data['order_ids']))
+        new_status = validated_data['status']
+
+        results = {}
+        with transaction.atomic():
+            # Ownership, current status and stock of every requested order in one query
+            current = Order.objects.select_for_update().filter(owner=partner, id__in=order_ids).values_list(
+                'id', 'status', 'beverage_id', 'quantity'
+            )
+            to_update, released = [], Counter()
+            for order_id, order_status, beverage_id, quantity in current:
+                if order_status == new_status:
+                    results[order_id] = 'unchanged'
+                elif new_status not in Order.STATUS_TRANSITIONS[order_status]:
+                    results[order_id] = 'not_allowed'
+                else:
+                    results[order_id] = 'updated'
+                    to_update.append(order_id)
+                    if new_status == 'cancelled':
+                        released[beverage_id] += quantity
+
+            if to_update:
+                Order.objects.filter(id__in=to_update).update(status=new_status, last_updated=timezone.now())
+                for beverage_id, quantity in released.items():
+                    Beverage.objects.release_stock(beverage_id, quantity)
+                # Bulk updates skip post_save, so open order streams are woken up here
+                transaction.on_commit(partial(order_events.publish, partner.id))
+
+        return {
+            'status': new_status,
+            'results': [{'id': order_id, 'result': results.get(order_id, 'not_found')} for order_id in order_ids]
+        }
 
 
 class DayStatisticsSerializer(serializers.Serializer):
@@ -279,3 +547,37 @@ class OrderStatisticsSerializer(serializers.Serializer):
     last_quarter = serializers.DictField(child=MonthStatisticsSerializer())
     this_year = serializers.DictField(child=QuarterStatisticsSerializer())
     last_year = serializers.DictField(child=QuarterStatisticsSerializer())
+
+
+class StatisticsSeriesQuerySerializer(serializers.Serializer):
+    MAX_BUCKETS = 744  # a month of hourly buckets
+
+    start = serializers.DateField()
+    end = serializers.DateField()
+    granularity = serializers.ChoiceField(choices=Order.statistics.SERIES_GRANULARITIES, default='day')
+    establishment_id = serializers.IntegerField(required=False)
+    beverage_id = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'end': 'End date must not be earlier than start date.'})
+        buckets = Order.statistics.count_series_periods(attrs['start'], attrs['end'], attrs['granularity'])
+        if buckets > self.MAX_BUCKETS:
+            raise serializers.ValidationError(
+                {'error': f'Requested range has {buckets} buckets, at most {self.MAX_BUCKETS} are allowed. '
+                 f'Narrow the range or use a coarser granularity.'}
+            )
+        return attrs
+
+
+class StatisticsSeriesBucketSerializer(serializers.Serializer):
+    period = serializers.CharField()
+    count = serializers.IntegerField()
+    sum = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class StatisticsSeriesSerializer(serializers.Serializer):
+    granularity = serializers.CharField()
+    start = serializers.DateField()
+    end = serializers.DateField()
+    series = StatisticsSeriesBucketSerializer(many=True)
@@ -0,0 +1,149 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from establishments.models import Establishment
+from menu.models import Beverage
+
+from .events import order_events
+from .models import EstablishmentCustomer, Order, OrderDailyRollup
+from .utils import invalidate_partner_stats
+
+# Order fields the visit history of a customer at an establishment is made of
+CUSTOMER_VISIT_FIELDS = ('establishment_id', 'order_date', 'is_deleted', 'line_total')
+
+
+def get_rollup_state(values):
+    '''
+    Returns the rollup bucket an order with the given field values counts towards along with
+    the amount it adds to it, or None when the order does not count at all. Like the statistics always did,
+    every order that is not soft-deleted counts whatever its status, cancelled ones included.
+    '''
+    if not values or values.get('is_deleted', True) or not values.get('establishment_id'):
+        return None
+    order_date = values['order_date']
+    if timezone.is_naive(order_date):
+        # Naive datetimes are stored as the default time zone
+        order_date = timezone.make_aware(order_date)
+    day = timezone.localtime(order_date).date()
+    return values['establishment_id'], values['beverage_id'], day, values.get('line_total') or 0
+
+
+def shift_rollup(state, sign):
+    establishment_id, beverage_id, day, line_total = state
+    OrderDailyRollup.objects.add(establishment_id, beverage_id, day, sign, sign * line_total)
+
+
+@receiver(post_save, sender=Order)
+def update_order_daily_rollup(sender, instance, created, raw=False, **kwargs):
+    '''
+    Moves the order between daily rollup buckets when it is created, soft-deleted, restored, re-dated or re-priced.
+    '''
+    if raw:
+        return
+    if not created and not hasattr(instance, '_loaded_values'):
+        # Nothing is known about the stored state of an order that was never loaded
+        return
+
+    previous = None if created else get_rollup_state(instance._loaded_values)
+    current = get_rollup_state(instance.get_tracked_values())
+
+    if previous == current:
+        return
+    if previous:
+        shift_rollup(previous, -1)
+    if current:
+        shift_rollup(current, 1)
+
+
+@receiver(post_save, sender=Order)
+def update_establishment_customer(sender, instance, created, raw=False, **kwargs):
+    '''
+    Counts a new order towards the customer's visit history at the establishment, and recounts the history
+    when an order is soft-deleted, restored, moved, re-dated or re-priced.
+    '''
+    if raw:
+        return
+    if created:
+        if not instance.is_deleted and instance.establishment_id:
+            EstablishmentCustomer.objects.add(
+                instance.establishment_id, instance.user_id, instance.order_date, instance.order_date, 1,
+                instance.line_total
+            )
+        return
+    if not hasattr(instance, '_loaded_values'):
+        return
+
+    previous, current = instance._loaded_values, instance.get_tracked_values()
+    if all(previous.get(field) == current.get(field) for field in CUSTOMER_VISIT_FIELDS):
+        return
+    for establishment_id in {previous.get('establishment_id'), instance.establishment_id} - {None}:
+        EstablishmentCustomer.objects.refresh(establishment_id, instance.user_id)
+
+
+@receiver(post_save, sender=Order)
+def release_cancelled_order_stock(sender, instance, created, raw=False, **kwargs):
+    '''
+    Puts the beverages of an order back in stock once it gets cancelled.
+    '''
+    if raw or created or not hasattr(instance, '_loaded_values'):
+        return
+    previous_status = instance._loaded_values.get('status')
+    if previous_status and previous_status != 'cancelled' and instance.status == 'cancelled':
+        Beverage.objects.release_stock(instance.beverage_id, instance.quantity)
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_daily_rollup(sender, instance, **kwargs):
+    state = get_rollup_state(getattr(instance, '_loaded_values', None))
+    if not state:
+        return
+    shift_rollup(state, -1)
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_from_establishment_customer(sender, instance, **kwargs):
+    if instance.establishment_id and not instance.is_deleted:
+        EstablishmentCustomer.objects.refresh(instance.establishment_id, instance.user_id)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_statistics(sender, instance, raw=False, **kwargs):
+    '''
+    Drops cached statistics of the partner whose establishment the order belongs to.
+    '''
+    if raw:
+        return
+    if instance.owner_id:
+        invalidate_partner_stats(instance.owner_id)
+
+
+@receiver(post_save, sender=Order)
+def publish_order_event(sender, instance, raw=False, **kwargs):
+    '''
+    Wakes up the partner's open order streams once the change is committed.
+    '''
+    if raw or not instance.owner_id:
+        return
+    transaction.on_commit(partial(order_events.publish, instance.owner_id))
+
+
+@receiver(post_save, sender=Establishment)
+def update_order_owners(sender, instance, raw=False, **kwargs):
+    '''
+    Keeps the denormalized owner of orders in line when an establishment changes hands.
+    '''
+    if raw:
+        return
+    orders = Order.everything.filter(establishment=instance).exclude(owner_id=instance.owner_id)
+    previous_owner_ids = set(orders.values_list('owner_id', flat=True).distinct())
+    if not previous_owner_ids:
+        return
+    orders.update(owner_id=instance.owner_id)
+    for partner_id in previous_owner_ids | {instance.owner_id}:
+        if partner_id:
+            invalidate_partner_stats(partner_id)
@@ -1,13 +1,19 @@
 from django.urls import path
 
 from .views import (
+    CustomerOrderHistoryView,
     CustomersOrderListCreateView,
     DetailedCustomerProfileView,
     FindCustomerByEmailView,
+    OrderStatisticsSeriesView,
     OrderStatisticsView,
     PartnerCustomersListView,
+    PartnersOrderBulkCreateView,
+    PartnersOrderBulkStatusView,
     PartnersOrderCreateView,
     PartnersOrderDetailView,
+    PartnersOrderEventsView,
+    PartnersOrderExportView,
     PartnersOrderListView,
 )
 
@@ -15,13 +21,21 @@ urlpatterns = [
     path('partners/', PartnersOrderListView.as_view(), name='partners-order-list'),
     path('partners/establishments/<int:establishment_id>/',
          PartnersOrderListView.as_view(), name='partners-order-list-by-establishment'),
+    path('partners/export/', PartnersOrderExportView.as_view(), name='partners-order-export'),
+    path('partners/establishments/<int:establishment_id>/export/',
+         PartnersOrderExportView.as_view(), name='partners-order-export-by-establishment'),
+    path('partners/bulk-create/', PartnersOrderBulkCreateView.as_view(), name='partners-order-bulk-create'),
+    path('partners/bulk-status/', PartnersOrderBulkStatusView.as_view(), name='partners-order-bulk-status'),
+    path('partners/events/', PartnersOrderEventsView.as_view(), name='partners-order-events'),
     path('partners/create/', PartnersOrderCreateView.as_view(), name='partners-order-create'),
     path('partners/<int:pk>/', PartnersOrderDetailView.as_view(), name='partners-order-detail'),
     path('partner-customers/', PartnerCustomersListView.as_view(), name='partner-customers-list'),
     path('partners-customers/<int:establishment_id>/',
          PartnerCustomersListView.as_view(), name='partner-customers-list-by-establishment'),
     path('partner-customers/<int:id>/', DetailedCustomerProfileView.as_view(), name='detailed-customer-profile'),
+    path('partner-customers/<int:id>/orders/', CustomerOrderHistoryView.as_view(), name='customer-order-history'),
     path('partners/stats/', OrderStatisticsView.as_view(), name='partner-stats'),
+    path('partners/stats/series/', OrderStatisticsSeriesView.as_view(), name='partner-stats-series'),
     path('partners/stats/<int:establishment_id>/', OrderStatisticsView.as_view(), name='partner-stats-by-establishment'),
     path('find-customer/', FindCustomerByEmailView.as_view(), name='find-customer'),
     path('customers/', CustomersOrderListCreateView.as_view(), name='customers-order-list-create'),
@@ -0,0 +1,73 @@
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+STATS_CACHE_PREFIX = 'order-stats'
+CURRENT_PERIOD_STATS_TIMEOUT = 60  # seconds
+CLOSED_PERIOD_STATS_TIMEOUT = 60 * 60 * 24  # seconds
+
+
+def get_stats_version_key(partner_id):
+    return f'{STATS_CACHE_PREFIX}:{partner_id}:version'
+
+
+def invalidate_partner_stats(partner_id):
+    '''
+    Makes every cached statistics entry of the partner unreachable by bumping its version.
+    '''
+    key = get_stats_version_key(partner_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_stats_version(partner_id):
+    '''
+    Returns the partner's current statistics version. A version that is missing, e.g. evicted, starts over
+    from the current time instead of 0, so entries cached under earlier versions never become reachable again.
+    '''
+    return cache.get_or_set(get_stats_version_key(partner_id), time.time_ns, timeout=None)
+
+
+def get_period_cache_key(partner_id, version, establishment_id, timeframe, start_date, end_date):
+    # Buckets are labelled by the given datetimes but filled by local days, so both are part of the key
+    period = '-'.join(
+        f'{date:%Y%m%d}{timezone.localtime(date):%Y%m%d}' for date in (start_date, end_date)
+    )
+    return f'{STATS_CACHE_PREFIX}:{partner_id}:{version}:{establishment_id or "all"}:{timeframe}:{period}'
+
+
+def get_cached_partner_stats(partner, timeframes, establishment_id=None):
+    '''
+    Returns statistics for every timeframe, computing only the ones missing in cache.
+    `timeframes` maps a timeframe name to a tuple of (stats method, start date, end date, is closed).
+    Closed periods are kept until the partner's orders change or for a day at most, the current ones only briefly.
+    '''
+    version = get_stats_version(partner.id)
+    keys = {
+        name: get_period_cache_key(partner.id, version, establishment_id, name, start_date, end_date)
+        for name, (_, start_date, end_date, _) in timeframes.items()
+    }
+    cached = cache.get_many(keys.values())
+
+    stats = {}
+    closed_periods, current_periods = {}, {}
+    for name, (get_stats, start_date, end_date, is_closed) in timeframes.items():
+        key = keys[name]
+        if key in cached:
+            stats[name] = cached[key]
+            continue
+        stats[name] = get_stats(partner, start_date, end_date, establishment_id)
+        if is_closed:
+            closed_periods[key] = stats[name]
+        else:
+            current_periods[key] = stats[name]
+
+    if closed_periods:
+        cache.set_many(closed_periods, timeout=CLOSED_PERIOD_STATS_TIMEOUT)
+    if current_periods:
+        cache.set_many(current_periods, timeout=CURRENT_PERIOD_STATS_TIMEOUT)
+
+    return stats
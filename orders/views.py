@@ -1,26 +1,49 @@
+import csv
+import json
 from datetime import datetime, timedelta
-
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Max, Min, Q, Sum
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.views import View
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import filters, generics, status
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
 from accounts.models import User
+from core.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
 
+from .events import decode_event_id, encode_event_id, order_events
 from .filters import PartnersOrdersListCustomFilter, UsersOrderListCustomFilter
 from .models import Order
+from .pagination import OrderListPagination
 from .permissions import IsCustomerOnly, IsPartnerOnly
 from .serializers import (
+    BulkOrderStatusSerializer,
     CustomerOrderSerializer,
     CustomerSerializer,
     DetailedCustomerProfileSerializer,
     FindCustomerByEmailSerializer,
+    OrderHistorySerializer,
     OrderStatisticsSerializer,
+    PartnerCustomerSerializer,
+    PartnersBulkCreateOrderListSerializer,
+    PartnersBulkCreateOrderSerializer,
     PartnersCreateOrderSerializer,
     PartnersDetailOrderSerializer,
+    StatisticsSeriesQuerySerializer,
+    StatisticsSeriesSerializer,
 )
+from .utils import get_cached_partner_stats
 
 
 class PartnersOrderListView(generics.ListAPIView):
@@ -30,6 +53,7 @@ class PartnersOrderListView(generics.ListAPIView):
     queryset = Order.objects.all()
     serializer_class = PartnersDetailOrderSerializer
     permission_classes = [IsPartnerOnly]
+    pagination_class = OrderListPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = PartnersOrdersListCustomFilter
 
@@ -102,17 +126,241 @@ class PartnersOrderListView(generics.ListAPIView):
 
         if establishment_id:
             queryset = Order.objects.filter(
-                beverage__menu__establishment__owner=partner,
-                beverage__menu__establishment__id=establishment_id
-            ).select_related('beverage', 'menu', 'menu__establishment').order_by('-order_date')
+                owner=partner,
+                establishment_id=establishment_id
+            ).select_related('beverage', 'establishment', 'user').order_by('-order_date')
         else:
             queryset = Order.objects.filter(
-                beverage__menu__establishment__owner=partner
-            ).select_related('beverage', 'menu', 'menu__establishment').order_by('-order_date')
+                owner=partner
+            ).select_related('beverage', 'establishment', 'user').order_by('-order_date')
 
         return queryset
 
 
+class Echo:
+    '''
+    File-like object that hands back what is written to it, lets csv.writer feed a streaming response.
+    '''
+
+    def write(self, value):
+        return value
+
+
+class PartnersOrderExportView(PartnersOrderListView):
+    '''
+    Stream every order matching the partners\' orders list filters as CSV or NDJSON.
+    WSGI servers stream the lines of a regular iterator, while under ASGI they are handed over through
+    an asynchronous iterator fetching one chunk at a time, since ASGI collects a synchronous iterator
+    in memory before sending it.
+    '''
+    pagination_class = None
+    chunk_size = 2000
+    export_fields = {
+        'id': 'id',
+        'user_email': 'user__email',
+        'user_first_name': 'user__first_name',
+        'user_last_name': 'user__last_name',
+        'establishment_name': 'establishment__name',
+        'beverage_name': 'beverage__name',
+        'beverage_price': 'unit_price',
+        'order_date': 'order_date',
+        'status': 'status',
+        'quantity': 'quantity',
+        'line_total': 'line_total',
+        'last_updated': 'last_updated',
+    }
+
+    @extend_schema(
+        summary='Export partners\' orders',
+        description=(
+            'Streams all orders of the partner\'s establishments in one response, '
+            'accepts the same filters as the partners\' orders list.\n'
+            '- Requires authentication.\n'
+            '- Permission: Partners only.'
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='export_format',
+                description='Format of the exported file, `csv` or `ndjson` (one JSON object per line).',
+                required=False,
+                enum=['csv', 'ndjson'],
+                default='csv'
+            )
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in ('csv', 'ndjson'):
+            return Response(
+                {'export_format': 'Export format must be either csv or ndjson.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        rows = self.filter_queryset(self.get_queryset()).values_list(
+            *self.export_fields.values()
+        ).iterator(chunk_size=self.chunk_size)
+
+        if export_format == 'csv':
+            content, content_type = self.stream_csv(rows), 'text/csv'
+        else:
+            content, content_type = self.stream_ndjson(rows), 'application/x-ndjson'
+        if isinstance(request._request, ASGIRequest):
+            content = self.iterate_in_chunks(content)
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+
+    async def iterate_in_chunks(self, lines):
+        '''
+        Asynchronous iterator over the lines, every chunk is fetched in the thread the database cursor belongs to.
+        '''
+        fetch_chunk = sync_to_async(lambda: list(islice(lines, self.chunk_size)))
+        while chunk := await fetch_chunk():
+            for line in chunk:
+                yield line
+
+    def format_row(self, row):
+        return [timezone.localtime(value).isoformat() if isinstance(value, datetime) else value for value in row]
+
+    def stream_csv(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.export_fields.keys())
+        for row in rows:
+            yield writer.writerow(self.format_row(row))
+
+    def stream_ndjson(self, rows):
+        fields = list(self.export_fields.keys())
+        for row in rows:
+            yield json.dumps(dict(zip(fields, self.format_row(row))), cls=DjangoJSONEncoder) + '\n'
+
+
+class PartnersOrderEventsView(View):
+    '''
+    Server-Sent Events stream of new and updated orders of the partner's establishments.
+    Needs to be served through ASGI (core.asgi). Each open stream keeps a worker thread for its queries,
+    the database connection is closed after every query so idle streams do not hold one, only the polls
+    running at the same time do.
+
+    Every event carries an id the client can resume from with the Last-Event-ID header or the
+    `last_event_id` query parameter. Changes saved by this process are pushed right away, the ones
+    saved by other processes are picked up on the next keepalive check.
+
+    Orders get their last_updated time before their transaction commits, so a change can become visible
+    after later ones were already sent. Changes from the last `commit_lag` before the position are scanned
+    again and the ones not sent yet are pushed late. After a resume they may be repeated, every event is
+    the whole order, clients keep the latest one per order id.
+    '''
+    keepalive_interval = 15  # seconds
+    retry_interval = 3000  # milliseconds
+    batch_size = 100
+    commit_lag = timedelta(seconds=30)
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            authenticated = await self.query(JWTAuthentication().authenticate, request)
+        except AuthenticationFailed as e:
+            return JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        if authenticated is None:
+            return JsonResponse(
+                {'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED
+            )
+        partner = authenticated[0]
+        if partner.role != 'partner':
+            return JsonResponse(
+                {'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN
+            )
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        if last_event_id:
+            position = decode_event_id(last_event_id)
+            if position is None:
+                return JsonResponse({'last_event_id': 'Invalid event id.'}, status=status.HTTP_400_BAD_REQUEST)
+            sent = set()
+        else:
+            position, sent = await self.query(self.get_latest_position, partner)
+
+        response = StreamingHttpResponse(self.stream(partner, position, sent), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, partner, position, sent):
+        # Subscribing before the first read makes sure no change falls in between
+        subscription = order_events.subscribe(partner.id)
+        try:
+            yield f'retry: {self.retry_interval}\n\n'
+            while True:
+                events, position = await self.query(self.get_events, partner, position, sent)
+                for event in events:
+                    yield event
+                if len(events) >= self.batch_size:
+                    continue
+                if not await subscription.wait(self.keepalive_interval):
+                    yield ': keepalive\n\n'
+        finally:
+            order_events.unsubscribe(subscription)
+
+    async def query(self, func, *args):
+        '''
+        Runs func in the stream's worker thread and closes the database connection it used afterwards,
+        unless a transaction is still open on it.
+        '''
+        def run():
+            try:
+                return func(*args)
+            finally:
+                if not connection.in_atomic_block:
+                    connection.close()
+
+        return await sync_to_async(run)()
+
+    def get_latest_position(self, partner):
+        '''
+        Returns the position of the latest change along with the changes within the commit lag before it,
+        a new stream starts after them and only pushes the ones committed later.
+        '''
+        latest = Order.everything.filter(owner=partner).order_by('-last_updated', '-id').values_list(
+            'last_updated', 'id'
+        ).first()
+        position = latest or (timezone.now(), 0)
+        recent = Order.objects.filter(owner=partner, last_updated__gt=position[0] - self.commit_lag)
+        return position, set(recent.values_list('id', 'last_updated'))
+
+    def get_events(self, partner, position, sent):
+        '''
+        Returns the formatted events of orders changed after the position, along with late commits from
+        within the commit lag before it that are not in `sent`, and the new position.
+        Sent (order id, last updated) pairs are added to `sent`, the ones older than the commit lag are dropped.
+        '''
+        last_updated, order_id = position
+        orders = Order.objects.filter(owner=partner).select_related('beverage', 'establishment', 'user')
+        late = [
+            order for order in orders.filter(
+                Q(last_updated__lt=last_updated) | Q(last_updated=last_updated, id__lte=order_id),
+                last_updated__gt=last_updated - self.commit_lag
+            ).order_by('last_updated', 'id')
+            if (order.id, order.last_updated) not in sent
+        ]
+        changed = list(orders.filter(
+            Q(last_updated__gt=last_updated) | Q(last_updated=last_updated, id__gt=order_id)
+        ).order_by('last_updated', 'id')[:self.batch_size])
+
+        # Late events carry the current position, resuming from them must not go back in time
+        events = [self.format_event(order, position) for order in late]
+        for order in changed:
+            events.append(self.format_event(order, (order.last_updated, order.id)))
+        sent.update((order.id, order.last_updated) for order in late + changed)
+        if changed:
+            position = changed[-1].last_updated, changed[-1].id
+        sent.difference_update([key for key in sent if key[1] <= position[0] - self.commit_lag])
+        return events, position
+
+    def format_event(self, order, position):
+        data = json.dumps(PartnersDetailOrderSerializer(order).data, cls=DjangoJSONEncoder)
+        return f'id: {encode_event_id(*position)}\nevent: order\ndata: {data}\n\n'
+
+
 class PartnersOrderDetailView(generics.RetrieveUpdateAPIView):
     '''
     Retrieve and update orders by partners
@@ -135,6 +383,8 @@ class PartnersOrderDetailView(generics.RetrieveUpdateAPIView):
         summary='Update order',
         description=(
             f'Partner can update only status of the order.\n'
+            f'- Only pending orders can be completed or cancelled.\n'
+            f'- Returns 409 when the status was changed by someone else in the meantime.\n'
             f'- Requires authentication.\n'
             f'- Permission: Partners only.'
         )
@@ -146,6 +396,8 @@ class PartnersOrderDetailView(generics.RetrieveUpdateAPIView):
         summary='Partially update order',
         description=(
             f'Partner can partially update only status of the order.\n'
+            f'- Only pending orders can be completed or cancelled.\n'
+            f'- Returns 409 when the status was changed by someone else in the meantime.\n'
             f'- Requires authentication.\n'
             f'- Permission: Partners only.'
         )
@@ -159,10 +411,36 @@ class PartnersOrderDetailView(generics.RetrieveUpdateAPIView):
         Filter the queryset to get all beverages ordered by establishments owned by the partner
         '''
         partner = self.request.user
-        queryset = Order.objects.filter(beverage__menu__establishment__owner=partner)
+        queryset = Order.objects.filter(owner=partner)
         return queryset
 
 
+class PartnersOrderBulkStatusView(generics.GenericAPIView):
+    '''
+    Update the status of many orders by partners at once
+    '''
+    serializer_class = BulkOrderStatusSerializer
+    permission_classes = [IsPartnerOnly]
+
+    @extend_schema(
+        summary='Bulk update orders status',
+        description=(
+            'Sets the given status on every listed order of the partner\'s establishments in a single update.\n'
+            '- Requires authentication.\n'
+            f'- At most {BulkOrderStatusSerializer.MAX_ORDERS} orders per request.\n'
+            '- Only pending orders can be completed or cancelled.\n'
+            '- Returns a result per order id: `updated`, `unchanged`, `not_found` or `not_allowed`.\n'
+            '- Permission: Partners only.'
+        )
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 class PartnersOrderCreateView(generics.CreateAPIView):
     ''''
     Create orders for customers by partners
@@ -193,34 +471,65 @@ class PartnersOrderCreateView(generics.CreateAPIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class PartnersOrderBulkCreateView(generics.GenericAPIView):
+    '''
+    Create many orders for customers by partners at once
+    '''
+    queryset = Order.objects.all()
+    serializer_class = PartnersBulkCreateOrderSerializer
+    permission_classes = [IsPartnerOnly]
+
+    @extend_schema(
+        summary='Partner bulk create orders',
+        description=(
+            'Create several orders for customers in one request, e.g. for a group tab.\n'
+            '- Requires authentication.\n'
+            '- Pass a list of items with beverage id, customer id and optional quantity.\n'
+            f'- At most {PartnersBulkCreateOrderListSerializer.MAX_ORDERS} orders per request.\n'
+            '- Beverages must belong to the partner\'s establishments, all orders are created or none.\n'
+            '- Returns the newly created orders.\n'
+            '- Permission: Partners only.'
+        ),
+        request=PartnersBulkCreateOrderSerializer(many=True),
+        responses=PartnersBulkCreateOrderSerializer(many=True)
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
 class PartnerCustomersListView(generics.ListAPIView):
     '''
     Retrieve a list of customers who have made orders at the partner's establishments.
-    Supports search by first name, last name, or email.
+    Supports search by first name, last name, or email and sorting by visits and spend.
     '''
-    serializer_class = CustomerSerializer
+    serializer_class = PartnerCustomerSerializer
     permission_classes = [IsPartnerOnly]
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['first_name', 'last_name', 'email']
+    ordering_fields = ['first_visit', 'last_visit', 'order_count', 'total_spent']
+    ordering = ['-last_visit', '-id']
 
     def get_queryset(self):
         '''
-        Filter orders to get those related to the establishments owned by the partner
+        Get the customers from the establishment customer table instead of the partner's orders,
+        a customer of several establishments gets their visits summed up
         '''
         partner = self.request.user
+        visits = {'establishment_visits__establishment__owner': partner}
         establishment_id = self.kwargs.get('establishment_id', None)
         if establishment_id:
-            partner_orders = Order.objects.filter(
-                beverage__menu__establishment__owner=partner,
-                beverage__menu__establishment__id=establishment_id
-            )
-        else:
-            partner_orders = Order.objects.filter(
-                beverage__menu__establishment__owner=partner
-            )
+            visits['establishment_visits__establishment_id'] = establishment_id
 
-        customer_ids = partner_orders.values_list('user', flat=True).distinct()
-        queryset = User.objects.filter(id__in=customer_ids)
+        queryset = User.objects.filter(**visits).annotate(
+            first_visit=Min('establishment_visits__first_visit'),
+            last_visit=Max('establishment_visits__last_visit'),
+            order_count=Sum('establishment_visits__order_count'),
+            total_spent=Sum('establishment_visits__total_spent')
+        )
         return queryset
 
     @extend_schema(
@@ -229,6 +538,9 @@ class PartnerCustomersListView(generics.ListAPIView):
             'Retrieve a list of customers who have made orders at the partner\'s establishments. '
             'Supports search by first name, last name, or email. '
             'If `establishment_id` is passed, get filtered list of customers for the specific establishment.\n'
+            '- Every customer comes with their first and last visit, number of orders and total spend.\n'
+            '- Sort with `ordering`: `last_visit`, `first_visit`, `order_count` or `total_spent`, '
+            'prefixed with `-` for descending order. Most recent visitors come first by default.\n'
             '- Permissions: Partner only.'
         )
     )
@@ -254,6 +566,41 @@ class DetailedCustomerProfileView(generics.RetrieveAPIView):
         description=(
             'Retrieve a detailed profile of a customer, including personal information and '
             'order history for the partner\'s establishments.\n'
+            '- `summary` holds the number of visits (days with orders), total spend, first and last visit '
+            'and favourite beverage.\n'
+            f'- `orders` holds the {DetailedCustomerProfileSerializer.RECENT_ORDERS} most recent orders, '
+            'the full history is paginated at `partner-customers/<id>/orders/`.\n'
+            '- Permissions: Partner only.'
+        )
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class CustomerOrderHistoryView(generics.ListAPIView):
+    '''
+    Retrieve the paginated order history of a customer at the partner's establishments.
+    '''
+    serializer_class = OrderHistorySerializer
+    permission_classes = [IsPartnerOnly]
+    pagination_class = OrderListPagination
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            # Returning an empty queryset to avoid errors during schema generation
+            return Order.objects.none()
+
+        partner = self.request.user
+        queryset = Order.objects.filter(owner=partner, user_id=self.kwargs['id']).select_related(
+            'beverage'
+        ).order_by('-order_date', '-id')
+        return queryset
+
+    @extend_schema(
+        summary='Get customer order history.',
+        description=(
+            'Retrieve the order history of a customer at the partner\'s establishments, most recent first.\n'
+            '- Supports limit/offset and cursor pagination.\n'
             '- Permissions: Partner only.'
         )
     )
@@ -311,6 +658,7 @@ class CustomersOrderListCreateView(generics.ListCreateAPIView):
 
     serializer_class = CustomerOrderSerializer
     permission_classes = [IsCustomerOnly]
+    pagination_class = OrderListPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = UsersOrderListCustomFilter
 
@@ -362,9 +710,12 @@ class CustomersOrderListCreateView(generics.ListCreateAPIView):
             '- Requires authentication.\n'
             '- To create new order pass beverages id to the field "beverage_id".\n'
             '- Returns the newly created order.\n'
+            '- Retries sent with the same `Idempotency-Key` header get the original response back.\n'
             '- Permission: Customers only.'
-        )
+        ),
+        parameters=[IDEMPOTENCY_KEY_PARAMETER]
     )
+    @idempotent
     def post(self, request, *args, **kwargs):
         '''
         Create a new order.
@@ -392,8 +743,7 @@ class CustomersOrderListCreateView(generics.ListCreateAPIView):
         customer = self.request.user
         queryset = Order.objects.filter(user=customer).select_related(
             'beverage',
-            'menu',
-            'menu__establishment',
+            'establishment',
             'user'
         ).order_by('-order_date')
         return queryset
@@ -473,15 +823,91 @@ class OrderStatisticsView(generics.GenericAPIView):
         last_year_start = self.get_start_of_year(today - timedelta(days=360))
         last_year_end = self.get_end_of_year(today - timedelta(days=360))
 
-        response_data = {
-            'this_week': Order.statistics.get_stats_by_day(partner, this_week_start, today, establishment_id),
-            'last_week': Order.statistics.get_stats_by_day(partner, last_week_start, last_week_end, establishment_id),
-            'this_month': Order.statistics.get_stats_by_week(partner, this_month_start, today, establishment_id),
-            'last_month': Order.statistics.get_stats_by_week(partner, last_month_start, last_month_end, establishment_id),
-            'this_quarter': Order.statistics.get_stats_by_month(partner, this_quarter_start, today, establishment_id),
-            'last_quarter': Order.statistics.get_stats_by_month(partner, last_quarter_start, last_quarter_end, establishment_id),
-            'this_year': Order.statistics.get_stats_by_quarter(partner, this_year_start, today, establishment_id),
-            'last_year': Order.statistics.get_stats_by_quarter(partner, last_year_start, last_year_end, establishment_id),
+        stats = Order.statistics
+        timeframes = {
+            'this_week': (stats.get_stats_by_day, this_week_start, today, False),
+            'last_week': (stats.get_stats_by_day, last_week_start, last_week_end, True),
+            'this_month': (stats.get_stats_by_week, this_month_start, today, False),
+            'last_month': (stats.get_stats_by_week, last_month_start, last_month_end, True),
+            'this_quarter': (stats.get_stats_by_month, this_quarter_start, today, False),
+            'last_quarter': (stats.get_stats_by_month, last_quarter_start, last_quarter_end, True),
+            'this_year': (stats.get_stats_by_quarter, this_year_start, today, False),
+            'last_year': (stats.get_stats_by_quarter, last_year_start, last_year_end, True),
         }
+        response_data = get_cached_partner_stats(partner, timeframes, establishment_id)
 
         return Response(response_data)
+
+
+class OrderStatisticsSeriesView(generics.GenericAPIView):
+    serializer_class = StatisticsSeriesSerializer
+    queryset = Order.objects.all()
+    permission_classes = [IsPartnerOnly]
+
+    @extend_schema(
+        summary='Get partners stats series',
+        description=(
+            'Returns a single series of order counts and beverage price sums for an arbitrary date range.\n'
+            'Only the requested series is computed, empty buckets are filled with zeros.\n'
+            '- Requires authentication.\n'
+            '- Permission: Partner only.\n\n'
+            f'At most {StatisticsSeriesQuerySerializer.MAX_BUCKETS} buckets can be requested at once.'
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='start',
+                description='First day of the range in YYYY-MM-DD format.',
+                required=True,
+                type=str
+            ),
+            OpenApiParameter(
+                name='end',
+                description='Last day of the range in YYYY-MM-DD format, inclusive.',
+                required=True,
+                type=str
+            ),
+            OpenApiParameter(
+                name='granularity',
+                description='Size of a single bucket of the series.',
+                required=False,
+                enum=list(Order.statistics.SERIES_GRANULARITIES),
+                default='day'
+            ),
+            OpenApiParameter(
+                name='establishment_id',
+                description='Only count orders of the given establishment.',
+                required=False,
+                type=int
+            ),
+            OpenApiParameter(
+                name='beverage_id',
+                description='Only count orders of the given beverage.',
+                required=False,
+                type=int
+            )
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        query_serializer = StatisticsSeriesQuerySerializer(data=request.query_params)
+        if not query_serializer.is_valid():
+            return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query_serializer.validated_data
+
+        series = Order.statistics.get_series(
+            request.user,
+            params['start'],
+            params['end'],
+            params['granularity'],
+            establishment_id=params.get('establishment_id'),
+            beverage_id=params.get('beverage_id')
+        )
+        for bucket in series:
+            bucket['period'] = bucket['period'].isoformat()
+
+        serializer = self.get_serializer({
+            'granularity': params['granularity'],
+            'start': params['start'],
+            'end': params['end'],
+            'series': series
+        })
+        return Response(serializer.data)
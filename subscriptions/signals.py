@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserSubscription
+from .utils import invalidate_entitlement
+
+
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+def invalidate_subscription_entitlement(sender, instance, **kwargs):
+    '''
+    Drops the cached entitlement of the user whose subscription changed.
+    '''
+    invalidate_entitlement(instance.user_id)
@@ -1,9 +1,16 @@
 import json
 
 import requests
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, When
 
 from core.settings import PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET
 
+from .models import UserSubscription
+
+ENTITLEMENT_CACHE_TIMEOUT = 5 * 60  # seconds, saves and deletes drop the entry from the shared cache right away
+NO_SUBSCRIPTION = 'NONE'
+
 
 def paypal_token(
     client_id=PAYPAL_CLIENT_ID,
@@ -24,3 +31,27 @@ def paypal_token(
     else:
         print('error:', response.text)
         raise
+
+
+def get_entitlement_cache_key(user_id):
+    return f'subscription-entitlement:{user_id}'
+
+
+def get_subscription_status(user):
+    '''
+    Returns the status of the user's newest active subscription, or of the newest one when none is active,
+    or NO_SUBSCRIPTION. Answered from cache, which is dropped whenever a subscription of the user changes.
+    Without a shared cache other processes only notice the change once their entry expires.
+    '''
+    key = get_entitlement_cache_key(user.id)
+    subscription_status = cache.get(key)
+    if subscription_status is None:
+        subscription_status = UserSubscription.objects.filter(user_id=user.id).order_by(
+            Case(When(status=UserSubscription.ACTIVE, then=0), default=1, output_field=IntegerField()), '-id'
+        ).values_list('status', flat=True).first() or NO_SUBSCRIPTION
+        cache.set(key, subscription_status, timeout=ENTITLEMENT_CACHE_TIMEOUT)
+    return subscription_status
+
+
+def invalidate_entitlement(user_id):
+    cache.delete(get_entitlement_cache_key(user_id))
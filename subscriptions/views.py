@@ -10,6 +10,7 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from core.idempotency import IDEMPOTENCY_KEY_PARAMETER, idempotent
 from menu.permissions import IsAdminOrReadOnly
 
 from .models import (
@@ -454,9 +455,13 @@ class CreatePayPalSubscriptionAPI(APIView):
         description=(
             'Endpoint that allows to transfer user to the PayPal payment page to pay for the subscription. '
             'In the field `plan_id` need to pass the plan_id that is given from PayPal. Available at `subscriptions/plans/` through `GET` method.\n'
+            '- Retries sent with the same `Idempotency-Key` header get the original response back without calling PayPal again, '
+            'the header requires authentication.\n'
             '- Permission: Allowed to anyone.'
-        )
+        ),
+        parameters=[IDEMPOTENCY_KEY_PARAMETER]
     )
+    @idempotent
     def post(self, request):
         serializer = CreatePaymentSerializer(data=request.data)
         if serializer.is_valid():
@@ -2,6 +2,7 @@ import io
 from datetime import datetime
 
 import pytest
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
 from faker import Faker
@@ -44,6 +45,14 @@ fake = Faker()
 fake.add_provider(KyrgyzPhoneNumberProvider)
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    '''
+    Keeps cached data from leaking between tests.
+    '''
+    cache.clear()
+
+
 @pytest.fixture
 def unauth_api_client():
     return APIClient()
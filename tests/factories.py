@@ -126,7 +126,7 @@ class BeverageFactory(DjangoModelFactory):
     category = SubFactory(CategoryFactory)
     price = LazyAttribute(lambda _: fake.pydecimal(3, 2, True))
     description = LazyFunction(fake.word)
-    in_stock = LazyAttribute(lambda _: fake.pyint(min_value=0, max_value=100))
+    in_stock = LazyAttribute(lambda _: fake.pyint(min_value=10, max_value=100))
 
 
 class EstablishmentBannerFactory(DjangoModelFactory):
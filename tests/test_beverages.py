@@ -1,8 +1,15 @@
 import json
+from decimal import Decimal
 
 import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.reverse import reverse
 
+from menu.filters import has_trigram_extension
+from menu.models import Beverage
+
 
 @pytest.mark.django_db
 def test_get_list_of_beverages_as_customer(
@@ -238,3 +245,169 @@ def test_delete_beverage_as_customer(
     # then:
     assert response.status_code == 403
     assert response.data['detail'] == 'You do not have permission to perform this action.'
+
+
+@pytest.mark.django_db
+def test_search_beverages_ranked_with_typos_and_categories(
+    jwt_auth_api_client,
+    create_num_of_beverages_in_one_menu_from_factories
+):
+    # given: beverages where only one is named mojito and another one mentions it in its description
+    client = jwt_auth_api_client('customer')
+    mojito, cocktail, espresso = create_num_of_beverages_in_one_menu_from_factories(3)
+    mojito.name, mojito.description = 'Mojito', 'Rum, lime and mint'
+    cocktail.name, cocktail.description = 'Hugo', 'Like a mojito, with elderflower'
+    espresso.name = 'Espresso'
+    for beverage in (mojito, cocktail, espresso):
+        beverage.save()
+    espresso.category.name = 'Coffee'
+    espresso.category.save()
+    url = reverse('beverage-list')
+    # when:
+    ranked = client.get(url, {'search': 'mojito'})
+    category = client.get(url, {'search': 'coffee'})
+    # then: names rank above descriptions and category names are found
+    assert [row['id'] for row in ranked.json()['results']] == [mojito.id, cocktail.id]
+    assert [row['id'] for row in category.json()['results']] == [espresso.id]
+    if not has_trigram_extension(connection.alias):
+        pytest.skip('pg_trgm is not available, typos are not searched for')
+    # when: the name is misspelled
+    typo = client.get(url, {'search': 'mojto'})
+    # then:
+    assert typo.json()['results'][0]['id'] == mojito.id
+
+
+@pytest.mark.django_db
+def test_search_beverages_by_price(jwt_auth_api_client, create_num_of_beverages_in_one_menu_from_factories):
+    # given:
+    client = jwt_auth_api_client('customer')
+    beverage, = create_num_of_beverages_in_one_menu_from_factories(1)
+    beverage.price = Decimal('12.50')
+    beverage.save()
+    url = reverse('beverage-list')
+    # when:
+    found = client.get(url, {'search': '12.50'})
+    # then:
+    assert [row['id'] for row in found.json()['results']] == [beverage.id]
+    # when: numbers that no price column can hold are searched for
+    for terms in ('NaN', 'sNaN', 'Infinity', '123456789', '1.001'):
+        response = client.get(url, {'search': terms})
+        # then: they are only matched as text
+        assert response.status_code == 200
+        assert response.json()['results'] == []
+
+
+@pytest.mark.django_db
+def test_beverage_catalog_filters_and_facets(
+    jwt_auth_api_client,
+    create_num_of_beverages_in_one_menu_from_factories
+):
+    # given: beverages of a venue, three of them sharing a category and two of those cheap and in stock
+    client = jwt_auth_api_client('customer')
+    cheap, also_cheap, expensive, sold_out = create_num_of_beverages_in_one_menu_from_factories(4)
+    also_cheap.category = expensive.category = cheap.category
+    for beverage, price, in_stock in ((cheap, 150, 5), (also_cheap, 250, 5), (expensive, 600, 5), (sold_out, 120, 0)):
+        beverage.price, beverage.in_stock = price, in_stock
+        beverage.save()
+    url = reverse('beverage-catalog')
+    # when: cheap beverages in stock of one category are browsed a page at a time
+    first_page = client.get(url, {'max_price': 300, 'in_stock': True, 'category': cheap.category_id, 'limit': 1})
+    second_page = client.get(first_page.json()['next'])
+    # then: matches come cheapest first, facets ignore their own filters
+    assert first_page.status_code == 200
+    results = first_page.json()['results'] + second_page.json()['results']
+    assert [row['id'] for row in results] == [cheap.id, also_cheap.id]
+    assert second_page.json()['next'] is None
+    facets = first_page.json()['facets']
+    assert facets['categories'] == [{'id': cheap.category_id, 'name': cheap.category.name, 'count': 2}]
+    prices = {facet['min_price']: facet['count'] for facet in facets['prices']}
+    assert prices == {'0.00': 0, '100.00': 1, '200.00': 1, '300.00': 0, '500.00': 1, '1000.00': 0}
+
+
+@pytest.mark.django_db
+def test_import_beverages_into_menu_as_partner(
+    jwt_auth_api_client_pass_user,
+    create_category_from_factory,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: partner with a menu of one beverage
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    menu, existing = dict_data['menu'], dict_data['beverages'][0]
+    category = create_category_from_factory
+    client = jwt_auth_api_client_pass_user(dict_data['partner'])
+    url = reverse('menu-beverage-import', args=[menu.id])
+    menu_etag = client.get(reverse('menu-detail', args=[menu.id]))['ETag']
+    data = {'beverages': [
+        {'name': existing.name.upper(), 'price': '75.00'},
+        {'name': 'Hugo', 'category': category.id, 'price': '250.00', 'in_stock': 12},
+    ]}
+    # when: the existing beverage gets a new price and a new one is added
+    response = client.post(url, data=data, format='json')
+    # then:
+    assert response.status_code == 200
+    assert response.json() == {'created': 1, 'updated': 1}
+    existing_in_stock = existing.in_stock
+    existing.refresh_from_db()
+    assert existing.price == Decimal('75.00')
+    assert existing.in_stock == existing_in_stock
+    hugo = Beverage.objects.get(menu=menu, name='Hugo')
+    assert (hugo.category_id, hugo.in_stock) == (category.id, 12)
+    assert client.get(reverse('beverage-list'), {'search': 'hugo'}).json()['results'][0]['id'] == hugo.id
+    assert client.get(reverse('menu-detail', args=[menu.id]))['ETag'] != menu_etag
+    # when: a CSV file is imported
+    upload = SimpleUploadedFile('menu.csv', b'name,category,price,in_stock\nHugo,,260.00,\nSpritz,,300.00,4\n')
+    response = client.post(url, data={'file': upload}, format='multipart')
+    # then:
+    assert response.status_code == 200
+    assert response.json() == {'created': 1, 'updated': 1}
+    assert Beverage.objects.get(id=hugo.id).price == Decimal('260.00')
+
+
+@pytest.mark.django_db
+def test_import_beverages_reports_row_errors(
+    jwt_auth_api_client_pass_user,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: partner with a menu
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    menu = dict_data['menu']
+    client = jwt_auth_api_client_pass_user(dict_data['partner'])
+    data = {'beverages': [
+        {'name': 'Hugo', 'price': '250.00'},
+        {'name': 'Spritz', 'category': 0, 'price': '300.00'},
+        {'name': 'Negroni'},
+    ]}
+    # when:
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.post(reverse('menu-beverage-import', args=[menu.id]), data=data, format='json')
+    # then: every invalid row is reported and nothing is saved
+    assert response.status_code == 400
+    assert [error['row'] for error in response.json()['errors']] == [2, 3]
+    assert 'category' in response.json()['errors'][0]['errors']
+    assert 'price' in response.json()['errors'][1]['errors']
+    assert not Beverage.objects.filter(menu=menu, name='Hugo').exists()
+    assert not any(query['sql'].startswith('INSERT') for query in ctx.captured_queries)
+
+
+@pytest.mark.django_db
+def test_beverage_catalog_search_ranked_and_invalid_filters(
+    jwt_auth_api_client,
+    create_num_of_beverages_in_one_menu_from_factories
+):
+    # given: a cheap beverage mentioning mojito in its description and a pricier one named mojito
+    client = jwt_auth_api_client('customer')
+    mojito, hugo = create_num_of_beverages_in_one_menu_from_factories(2)
+    mojito.name, mojito.price = 'Mojito', 300
+    hugo.name, hugo.description, hugo.price = 'Hugo', 'Like a mojito', 100
+    mojito.save()
+    hugo.save()
+    url = reverse('beverage-catalog')
+    # when: the catalog is searched a beverage at a time
+    first_page = client.get(url, {'search': 'mojito', 'limit': 1})
+    second_page = client.get(first_page.json()['next'])
+    # then: the most relevant one comes first despite its price
+    assert [row['id'] for row in first_page.json()['results'] + second_page.json()['results']] == [mojito.id, hugo.id]
+    # when: a category is not a number
+    response = client.get(url, {'category': 'abc'})
+    # then:
+    assert response.status_code == 400
@@ -1,4 +1,6 @@
 import json
+from datetime import time
+from decimal import Decimal
 
 import pytest
 from rest_framework.reverse import reverse
@@ -465,3 +467,61 @@ def test_delete_establishment_banner_as_customer(
     # then:
     assert response.status_code == 403
     assert response.data['detail'] == 'You do not have permission to perform this action.'
+
+
+@pytest.mark.django_db
+def test_get_establishments_with_happy_hour_at_time(
+    jwt_auth_api_client,
+    create_num_of_establishments_from_factory
+):
+    # given: establishments with a daytime, a midnight-spanning and no happy hour
+    client = jwt_auth_api_client(role='customer')
+    daytime, overnight, without = create_num_of_establishments_from_factory(3)
+    daytime.happy_hour_start, daytime.happy_hour_end = time(10, 0), time(12, 0)
+    daytime.save()
+    overnight.happy_hour_start, overnight.happy_hour_end = time(22, 0), time(2, 0)
+    overnight.save()
+    without.happy_hour_start, without.happy_hour_end = None, None
+    without.save()
+    url = reverse('establishments-happy-hour')
+    # when:
+    responses = {at: client.get(url, {'time': at}) for at in ('11:00', '12:00', '12:01', '23:30', '01:00')}
+    # then:
+    assert all(response.status_code == 200 for response in responses.values())
+    found = {at: [establishment['id'] for establishment in response.json()] for at, response in responses.items()}
+    assert found == {
+        '11:00': [daytime.id],
+        '12:00': [daytime.id],
+        '12:01': [],
+        '23:30': [overnight.id],
+        '01:00': [overnight.id],
+    }
+    # when: the daytime establishment moves its happy hour
+    daytime.happy_hour_start, daytime.happy_hour_end = time(0, 30), time(1, 30)
+    daytime.save()
+    response = client.get(url, {'time': '01:00'})
+    # then: the index is refreshed
+    assert sorted(establishment['id'] for establishment in response.json()) == sorted([daytime.id, overnight.id])
+
+
+@pytest.mark.django_db
+def test_get_establishments_with_happy_hour_near_point(
+    jwt_auth_api_client,
+    create_num_of_establishments_from_factory
+):
+    # given: two establishments in happy hour, one nearby and one in another city
+    client = jwt_auth_api_client(role='customer')
+    nearby, far = create_num_of_establishments_from_factory(2)
+    for establishment, latitude, longitude in ((nearby, '42.87600000', '74.60300000'), (far, '40.51300000', '72.81600000')):
+        establishment.latitude, establishment.longitude = Decimal(latitude), Decimal(longitude)
+        establishment.happy_hour_start, establishment.happy_hour_end = time(0, 0), time(23, 59)
+        establishment.save()
+    # when:
+    response = client.get(
+        reverse('establishments-happy-hour'),
+        {'time': '18:00', 'latitude': 42.8746, 'longitude': 74.5698, 'radius': 5}
+    )
+    # then: only the nearby establishment is returned along with its distance
+    assert response.status_code == 200
+    assert [establishment['id'] for establishment in response.json()] == [nearby.id]
+    assert 2 < response.json()[0]['distance'] < 3
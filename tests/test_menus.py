@@ -1,8 +1,12 @@
 import json
 
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.reverse import reverse
 
+from menu.models import Beverage, Menu, MenuSnapshot
+
 
 @pytest.mark.django_db
 def test_post_menu_as_customer(
@@ -195,3 +199,89 @@ def test_delete_beverage_not_seen_in_all_parts_by_customer(
     print('check_menu_detail_response:', check_menu_detail_response.data)
     assert check_menu_detail_response.status_code == 200
     assert len(check_menu_detail_response.data['beverages']) == num_of_bevs - 1
+
+
+@pytest.mark.django_db
+def test_num_of_queries_to_get_menus_list_does_not_grow_with_menus(
+    create_user_from_factory,
+    jwt_auth_api_client_pass_user,
+    create_establishment_passing_partner_as_owner_from_factory,
+    create_menu_of_specific_establishment_from_factory,
+    create_num_of_beverages_in_one_menu_from_outside_factory
+):
+    # given: partner with a menu of 3 beverages
+    partner = create_user_from_factory('partner')
+    client = jwt_auth_api_client_pass_user(partner)
+
+    def add_menu():
+        menu = create_menu_of_specific_establishment_from_factory(
+            create_establishment_passing_partner_as_owner_from_factory(partner)
+        )
+        return menu, create_num_of_beverages_in_one_menu_from_outside_factory(menu, 3)
+
+    add_menu()
+    url = reverse('menu-list')
+    with CaptureQueriesContext(connection) as one_menu:
+        client.get(url)
+    # when: the partner has 3 more menus, one of them with a deleted beverage
+    menus = [add_menu() for _ in range(3)]
+    menus[0][1][0].soft_delete()
+    with CaptureQueriesContext(connection) as many_menus:
+        response = client.get(url)
+    # then: beverages of all menus are loaded at once
+    assert response.status_code == 200
+    assert len(many_menus) == len(one_menu)
+    beverages = {menu['id']: menu['beverages'] for menu in response.data['results']}
+    assert len(beverages) == 4
+    assert [beverage['id'] for beverage in beverages[menus[0][0].id]] == [bev.id for bev in menus[0][1][1:]]
+
+
+@pytest.mark.django_db
+def test_get_menu_served_from_snapshot_with_etag(
+    jwt_auth_api_client,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: a menu with 3 beverages, one of them named like the stock placeholder
+    client = jwt_auth_api_client('customer')
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(3)
+    menu, beverages = dict_data['menu'], dict_data['beverages']
+    beverages[2].name = '"@@in_stock:1@@"'
+    beverages[2].save()
+    url = reverse('menu-detail', args=[menu.id])
+    first = client.get(url)
+    # when: the unchanged menu is requested again, with and without its ETag
+    with CaptureQueriesContext(connection) as ctx:
+        not_modified = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+    not_modified_queries = len(ctx)
+    repeated = client.get(url)
+    # then: the stored snapshot is served without rendering the menu again, after the menu query only
+    assert first.status_code == 200
+    assert len(first.json()['beverages']) == 3
+    assert beverages[2].name in [beverage['name'] for beverage in first.json()['beverages']]
+    assert not_modified.status_code == 304
+    assert not_modified['ETag'] == first['ETag']
+    assert not_modified_queries == 2  # the user for jwt auth, then the menu with its snapshot and stock version
+    assert repeated.content == first.content
+    # when: a beverage changes
+    beverages[0].price += 1
+    beverages[0].save()
+    changed = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+    # then: the snapshot is rebuilt
+    assert changed.status_code == 200
+    assert changed['ETag'] != first['ETag']
+    prices = {beverage['id']: beverage['price'] for beverage in changed.json()['beverages']}
+    assert prices[beverages[0].id] == str(beverages[0].price)
+    # when: a beverage is sold
+    with CaptureQueriesContext(connection) as ctx:
+        Beverage.objects.reserve_stock(beverages[1].id, 1)
+    # then: the menu is not marked as changed
+    assert not any('"menu_menu"' in query['sql'] for query in ctx.captured_queries)
+    # when: the menu is requested again
+    sold = client.get(url, HTTP_IF_NONE_MATCH=changed['ETag'])
+    # then: the stock is spliced into the stored snapshot
+    assert sold.status_code == 200
+    assert sold['ETag'] != changed['ETag']
+    stock = {beverage['id']: beverage['in_stock'] for beverage in sold.json()['beverages']}
+    assert stock == {beverage.id: beverage.in_stock - (beverage == beverages[1]) for beverage in beverages}
+    assert MenuSnapshot.objects.get(menu=menu).version == Menu.objects.get(id=menu.id).updated_at
+    assert client.get(url, HTTP_IF_NONE_MATCH=sold['ETag']).status_code == 304
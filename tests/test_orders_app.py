@@ -1,17 +1,35 @@
+import asyncio
 import calendar
+import hashlib
 import json
 import re
+import threading
 from datetime import datetime, timedelta
+from decimal import Decimal
 from random import choice
 
 import pytest
 import pytz
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
 from django.db import connection
+from django.test import AsyncClient
 from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 
-from orders.models import Order
+from core.models import IdempotencyKey
+from orders.events import order_events
+from orders.models import EstablishmentCustomer, HappyHourClaim, Order, OrderDailyRollup
+from orders.serializers import OrderStatusConflict, PartnersDetailOrderSerializer
+from orders.utils import get_stats_version_key
+from orders.views import PartnersOrderEventsView
+from subscriptions.utils import NO_SUBSCRIPTION, get_subscription_status
+from tests.factories import OrderFactory
 
 
 @pytest.mark.django_db
@@ -62,6 +80,149 @@ def test_create_order_during_happy_hours_as_customer(
     assert response.json()['beverage_name'] == beverage.name
 
 
+@pytest.mark.django_db
+def test_retried_order_with_idempotency_key_as_customer(
+    jwt_auth_api_user_and_client,
+    create_beverage_from_factory,
+    create_user_subscription
+):
+    # given: authenticated customer and a beverage during happy hours
+    user, client = jwt_auth_api_user_and_client(role='customer')
+    create_user_subscription(user)
+    beverage = create_beverage_from_factory
+    establishment = beverage.menu.establishment
+    establishment.happy_hour_start = timezone.localtime(timezone.now()).time()
+    establishment.happy_hour_end = (timezone.localtime(timezone.now()) + timezone.timedelta(hours=1)).time()
+    establishment.save()
+    url = reverse('customers-order-list-create')
+    data = json.dumps({'beverage_id': beverage.id})
+    # when: the same request is sent twice with one key
+    first = client.post(url, data=data, content_type='application/json', HTTP_IDEMPOTENCY_KEY='order-1')
+    retry = client.post(url, data=data, content_type='application/json', HTTP_IDEMPOTENCY_KEY='order-1')
+    # then: the retry gets the original response and no second order is made
+    assert first.status_code == 201
+    assert retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry['Idempotent-Replayed'] == 'true'
+    assert Order.objects.filter(user=user).count() == 1
+    # when: the key is reused for another request
+    other = client.post(
+        url, data=json.dumps({'beverage_id': beverage.id + 1}), content_type='application/json',
+        HTTP_IDEMPOTENCY_KEY='order-1'
+    )
+    # then:
+    assert other.status_code == 422
+
+
+@pytest.mark.django_db
+def test_retried_order_takes_over_idempotency_key_of_lost_request_as_customer(
+    jwt_auth_api_user_and_client,
+    create_beverage_from_factory,
+    create_user_subscription
+):
+    # given: a beverage during happy hours and a key claimed by a request that is still unfinished
+    user, client = jwt_auth_api_user_and_client(role='customer')
+    create_user_subscription(user)
+    beverage = create_beverage_from_factory
+    establishment = beverage.menu.establishment
+    establishment.happy_hour_start = timezone.localtime(timezone.now()).time()
+    establishment.happy_hour_end = (timezone.localtime(timezone.now()) + timezone.timedelta(hours=1)).time()
+    establishment.save()
+    url = reverse('customers-order-list-create')
+    data = json.dumps({'beverage_id': beverage.id})
+    lookup = {'scope': f'user:{user.pk}', 'endpoint': f'POST {url}', 'key': 'order-1'}
+    record = IdempotencyKey.objects.create(
+        request_hash=hashlib.sha256(json.dumps({'beverage_id': beverage.id}).encode()).hexdigest(),
+        expires_at=timezone.now() + settings.IDEMPOTENCY_KEY_TTL, **lookup
+    )
+    # when: it is retried within the processing lease
+    busy = client.post(url, data=data, content_type='application/json', HTTP_IDEMPOTENCY_KEY='order-1')
+    # then:
+    assert busy.status_code == 409
+    # when: it is retried after the lease ran out
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        created_at=timezone.now() - settings.IDEMPOTENCY_PROCESSING_LEASE
+    )
+    retry = client.post(url, data=data, content_type='application/json', HTTP_IDEMPOTENCY_KEY='order-1')
+    # then: the retry is handled and its response stored for the key
+    assert retry.status_code == 201
+    assert IdempotencyKey.objects.get(pk=record.pk).status_code == 201
+    assert Order.objects.filter(user=user).count() == 1
+
+
+@pytest.mark.django_db
+def test_idempotency_key_requires_authentication():
+    # given: anonymous client
+    client = APIClient()
+    # when:
+    response = client.post(
+        reverse('create-subscription'), data={'plan_id': 'P-1'}, format='json', HTTP_IDEMPOTENCY_KEY='subscription-1'
+    )
+    # then: the key is refused before anything is done
+    assert response.status_code == 401
+    assert not IdempotencyKey.objects.exists()
+
+
+@pytest.mark.django_db
+def test_num_of_queries_sent_to_db_to_create_order_as_customer(
+    jwt_auth_api_user_and_client,
+    create_beverage_from_factory,
+    create_user_subscription
+):
+    # given: authenticated subscribed customer and a beverage during happy hours
+    user, client = jwt_auth_api_user_and_client(role='customer')
+    create_user_subscription(user)
+    beverage = create_beverage_from_factory
+    establishment = beverage.menu.establishment
+    establishment.happy_hour_start = timezone.localtime(timezone.now()).time()
+    establishment.happy_hour_end = (timezone.localtime(timezone.now()) + timezone.timedelta(hours=1)).time()
+    establishment.save()
+    # subscription status is served from cache after the first lookup
+    get_subscription_status(user)
+    query_get_users_from_jwt = 1
+    query_get_beverage_menu_and_establishment = 1
+    query_reserve_stock = 1
+    queries_insert_claim_and_order = 4  # savepoint, claim, order, release
+    query_upsert_rollup = 1
+    query_upsert_establishment_customer = 1
+    # when:
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.post(
+            reverse('customers-order-list-create'),
+            data=json.dumps({'beverage_id': beverage.id}),
+            content_type='application/json'
+        )
+    # then:
+    assert response.status_code == 201
+    expected_queries = query_get_users_from_jwt + query_get_beverage_menu_and_establishment + query_reserve_stock
+    expected_queries += queries_insert_claim_and_order + query_upsert_rollup + query_upsert_establishment_customer
+    assert len(ctx) == expected_queries
+
+
+@pytest.mark.django_db
+def test_subscription_status_cache_follows_subscription_changes(
+    create_user_from_factory,
+    create_user_subscription
+):
+    # given: customer with a cancelled and an active subscription
+    user = create_user_from_factory('customer')
+    assert get_subscription_status(user) == NO_SUBSCRIPTION
+    active = create_user_subscription(user)
+    cancelled = create_user_subscription(user)
+    cancelled.status = 'CANCELLED'
+    cancelled.save()
+    # then: the active one wins and is answered from cache
+    assert get_subscription_status(user) == 'ACTIVE'
+    with CaptureQueriesContext(connection) as ctx:
+        assert get_subscription_status(user) == 'ACTIVE'
+    assert len(ctx) == 0
+    # when: the active subscription gets suspended
+    active.status = 'SUSPENDED'
+    active.save()
+    # then: the newest one is reported
+    assert get_subscription_status(user) == 'CANCELLED'
+
+
 @pytest.mark.django_db
 def test_create_order_outside_happy_hours_as_customer(
     jwt_auth_api_user_and_client,
@@ -178,6 +339,7 @@ def test_update_order_status_as_partner(
     order = create_order_from_factory
     order.beverage.menu.establishment.owner = user
     order.beverage.menu.establishment.save()
+    Order.objects.filter(id=order.id).update(status='pending')
     update_data = {'status': 'cancelled'}
     # when:
     url = reverse('partners-order-detail', args=[order.id])
@@ -192,6 +354,136 @@ def test_update_order_status_as_partner(
     assert response.json()['status'] == 'cancelled'
 
 
+@pytest.mark.django_db
+def test_order_status_transitions_as_partner(
+    jwt_auth_api_user_and_client,
+    create_order_from_factory
+):
+    # given: a pending order of the partner that someone else completes after it was read
+    user, client = jwt_auth_api_user_and_client(role='partner')
+    order = create_order_from_factory
+    order.beverage.menu.establishment.owner = user
+    order.beverage.menu.establishment.save()
+    Order.objects.filter(id=order.id).update(status='pending')
+    order.refresh_from_db()
+    serializer = PartnersDetailOrderSerializer(order, data={'status': 'cancelled'}, partial=True)
+    assert serializer.is_valid()
+    Order.objects.filter(id=order.id).update(status='completed')
+    # when: the stale change is saved
+    # then: it is rejected with a conflict instead of overwriting the completed status
+    with pytest.raises(OrderStatusConflict):
+        serializer.save()
+    order.refresh_from_db()
+    assert order.status == 'completed'
+    # when: the completed order is cancelled through the api
+    url = reverse('partners-order-detail', args=[order.id])
+    response = client.patch(url, data=json.dumps({'status': 'cancelled'}), content_type='application/json')
+    # then: completed orders are final
+    assert response.status_code == 400
+    order.refresh_from_db()
+    assert order.status == 'completed'
+
+
+@pytest.mark.django_db
+def test_order_status_update_is_single_conditional_update(
+    jwt_auth_api_user_and_client,
+    create_order_from_factory
+):
+    # given: a pending order of the partner
+    user, client = jwt_auth_api_user_and_client(role='partner')
+    order = create_order_from_factory
+    order.beverage.menu.establishment.owner = user
+    order.beverage.menu.establishment.save()
+    Order.objects.filter(id=order.id).update(status='pending')
+    url = reverse('partners-order-detail', args=[order.id])
+    # when:
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.patch(url, data=json.dumps({'status': 'completed'}), content_type='application/json')
+    # then: only the status columns are written, guarded by the status the order was read with
+    updates = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('UPDATE')]
+    assert response.status_code == 200
+    assert response.json()['status'] == 'completed'
+    assert len(updates) == 1
+    assert '"status" = \'pending\'' in updates[0]
+    assert '"quantity"' not in updates[0]
+
+
+@pytest.mark.django_db
+def test_bulk_update_orders_status_as_partner(
+    create_user_from_factory,
+    create_order_from_factory,
+    jwt_auth_api_client_pass_user,
+    create_order_passing_bev_menu_user_at_specific_date,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: partner with a pending and a completed order, and an order of someone else
+    customer = create_user_from_factory('customer')
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    pending, completed = [create_order_passing_bev_menu_user_at_specific_date(
+        beverage=dict_data['beverages'][0],
+        menu=dict_data['menu'],
+        user=customer
+    ) for _ in range(2)]
+    Order.objects.filter(id=pending.id).update(status='pending')
+    Order.objects.filter(id=completed.id).update(status='completed')
+    foreign = create_order_from_factory
+    client = jwt_auth_api_client_pass_user(dict_data['partner'])
+    data = {'order_ids': [pending.id, completed.id, foreign.id], 'status': 'completed'}
+    # when:
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.post(reverse('partners-order-bulk-status'), data=data, format='json')
+    # then: only the partner's pending order is touched, with a single update
+    assert response.status_code == 200
+    assert response.json()['results'] == [
+        {'id': pending.id, 'result': 'updated'},
+        {'id': completed.id, 'result': 'unchanged'},
+        {'id': foreign.id, 'result': 'not_found'},
+    ]
+    assert len([query for query in ctx.captured_queries if query['sql'].startswith('UPDATE')]) == 1
+    pending.refresh_from_db()
+    foreign_status = foreign.status
+    foreign.refresh_from_db()
+    assert pending.status == 'completed'
+    assert foreign.status == foreign_status
+
+
+@pytest.mark.django_db
+def test_bulk_create_orders_as_partner(
+    create_beverage_from_factory,
+    jwt_auth_api_client_pass_user,
+    create_num_of_users_from_factory,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: partner with two beverages and a group of customers
+    customers = create_num_of_users_from_factory(3)
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(2)
+    beverages = dict_data['beverages']
+    client = jwt_auth_api_client_pass_user(dict_data['partner'])
+    url = reverse('partners-order-bulk-create')
+    data = [
+        {'beverage_id': beverages[i % 2].id, 'customer_id': customer.id, 'quantity': i + 1}
+        for i, customer in enumerate(customers)
+    ]
+    # when:
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.post(url, data=data, format='json')
+    # then: all orders are inserted at once and counted in the rollup
+    assert response.status_code == 201
+    assert [order['quantity'] for order in response.json()] == [1, 2, 3]
+    assert len([query for query in ctx.captured_queries if query['sql'].startswith('INSERT INTO "orders_order"')]) == 1
+    orders = Order.objects.filter(owner=dict_data['partner'])
+    assert orders.count() == 3
+    assert sum(rollup.count for rollup in OrderDailyRollup.objects.filter(establishment=dict_data['establishment'])) == 3
+    assert all(order.line_total == order.unit_price * order.quantity for order in orders)
+    # when: one of the beverages belongs to someone else
+    foreign_beverage = create_beverage_from_factory
+    data[0]['beverage_id'] = foreign_beverage.id
+    response = client.post(url, data=data, format='json')
+    # then: nothing is created
+    assert response.status_code == 400
+    assert orders.count() == 3
+
+
 @pytest.mark.django_db
 def test_partner_customers_list(
     jwt_auth_api_client,
@@ -215,6 +507,56 @@ def test_partner_customers_list(
     assert response.data['results'][0]['email'] == customer1.email
 
 
+@pytest.mark.django_db
+def test_partner_customers_list_sorted_by_visit_history(
+    jwt_auth_api_client_pass_user,
+    setup_partner_with_orders
+):
+    # given: a partner whose first customer made 3 orders and the second one 2
+    partner, customer1, customer2 = setup_partner_with_orders
+    client = jwt_auth_api_client_pass_user(partner)
+    url = reverse('partner-customers-list')
+    spent = {
+        customer.id: sum(order.line_total for order in Order.objects.filter(user=customer))
+        for customer in (customer1, customer2)
+    }
+    # when: customers are sorted by number of orders
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(url, {'ordering': '-order_count'})
+    # then: the list comes from the visit history without reading orders
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert [row['id'] for row in results] == [customer1.id, customer2.id]
+    assert [row['order_count'] for row in results] == [3, 2]
+    assert all(Decimal(row['total_spent']) == spent[row['id']] for row in results)
+    assert not any('"orders_order"' in query['sql'] for query in ctx.captured_queries)
+    # when: a new order of the second customer comes in
+    order = Order.objects.filter(user=customer2).first()
+    Order.objects.create(user=customer2, menu=order.menu, beverage=order.beverage)
+    response = client.get(url)
+    # then: they are the most recent visitor
+    assert response.json()['results'][0]['id'] == customer2.id
+    assert response.json()['results'][0]['order_count'] == 3
+    # when: an order of the first customer is soft-deleted and another one deleted for good
+    first, second, _ = Order.objects.filter(user=customer1).order_by('id')
+    first.soft_delete()
+    second.delete(hard=True)
+    response = client.get(url, {'ordering': '-order_count'})
+    # then: the visit history matches a rebuild from the orders table
+    counts = {row['id']: row['order_count'] for row in response.json()['results']}
+    assert counts == {customer1.id: 1, customer2.id: 3}
+    expected = set(EstablishmentCustomer.objects.values_list('customer_id', 'order_count', 'total_spent', 'first_visit'))
+    EstablishmentCustomer.objects.rebuild()
+    assert set(EstablishmentCustomer.objects.values_list(
+        'customer_id', 'order_count', 'total_spent', 'first_visit'
+    )) == expected
+    # when: the soft-deleted order is restored
+    first.restore()
+    response = client.get(url, {'ordering': '-order_count'})
+    # then:
+    assert {row['id']: row['order_count'] for row in response.json()['results']}[customer1.id] == 2
+
+
 @pytest.mark.django_db
 def test_partner_customers_list_unauthorized(jwt_auth_api_client):
     client = jwt_auth_api_client(role='customer')
@@ -256,6 +598,43 @@ def test_detailed_customer_profile(
     print(response.data)
 
 
+@pytest.mark.django_db
+def test_customer_profile_summary_and_order_history(
+    setup_partner_with_orders,
+    jwt_auth_api_client_pass_user
+):
+    # given: a customer with 3 orders at the partner's establishments and a second beverage of the first one,
+    # ordered on the same visit
+    partner, customer1, customer2 = setup_partner_with_orders
+    client = jwt_auth_api_client_pass_user(partner)
+    orders = list(Order.objects.filter(user=customer1).order_by('id'))
+    Order.objects.create(
+        user=customer1, menu=orders[0].menu, beverage=orders[0].beverage, order_date=orders[0].order_date
+    )
+    # when:
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(reverse('detailed-customer-profile', args=[customer1.id]))
+    # then: the summary comes from one grouped query and the recent orders from another
+    assert response.status_code == 200
+    summary = response.json()['summary']
+    assert summary['visit_count'] == len({timezone.localtime(order.order_date).date() for order in orders})
+    assert Decimal(summary['total_spent']) == sum(order.line_total for order in Order.objects.filter(user=customer1))
+    assert summary['favourite_beverage'] == {
+        'id': orders[0].beverage_id, 'name': orders[0].beverage.name, 'order_count': 2
+    }
+    assert len(response.json()['orders']) == 4
+    assert len([query for query in ctx.captured_queries if '"orders_order"' in query['sql']]) == 2
+    # when: the full history is paged through
+    url = reverse('customer-order-history', args=[customer1.id])
+    first_page = client.get(url, {'limit': 3})
+    second_page = client.get(first_page.json()['next'])
+    # then:
+    assert first_page.json()['count'] == 4
+    history = first_page.json()['results'] + second_page.json()['results']
+    assert [order['id'] for order in history] == [order['id'] for order in response.json()['orders']]
+    assert not client.get(reverse('customer-order-history', args=[customer2.id]), {'limit': 3}).json()['next']
+
+
 @pytest.mark.djnago_db
 def test_num_of_queries_sent_to_db_to_get_list_of_orders_as_customer(
     create_num_of_orders_for_one_user_from_factory,
@@ -697,3 +1076,549 @@ def test_get_stats_for_partner_for_last_year_as_partner(
     for i in range(1, 5):
         assert response.data['last_year'][f'Q{i}_{last_year}']['count'] == total_counts[i - 1]
         assert response.data['last_year'][f'Q{i}_{last_year}']['sum'] == total_sums[i - 1]
+
+
+@pytest.mark.django_db
+def test_num_of_queries_sent_to_db_to_get_stats_as_partner(
+    create_num_of_users_from_factory,
+    jwt_auth_api_client_pass_user,
+    create_order_passing_bev_menu_user_at_specific_date,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: auth partner with orders spread over the last year
+    customers = create_num_of_users_from_factory(3)
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(2)
+    partner = dict_data['partner']
+    menu = dict_data['menu']
+    beverages = dict_data['beverages']
+    today = timezone.now()
+    for i in range(0, 400, 20):
+        create_order_passing_bev_menu_user_at_specific_date(
+            beverage=choice(beverages),
+            menu=menu,
+            user=choice(customers),
+            order_date=today - timedelta(days=i)
+        )
+    client = jwt_auth_api_client_pass_user(partner)
+    query_get_users_from_jwt = 1
+    query_per_timeframe = 8
+    # when: partner is accessing stats endpoint
+    with CaptureQueriesContext(connection) as ctx:
+        url = reverse('partner-stats')
+        response = client.get(url)
+    # then: every timeframe is computed with a single grouped query
+    assert response.status_code == 200
+    assert len(ctx) == query_get_users_from_jwt + query_per_timeframe
+
+
+@pytest.mark.django_db
+def test_order_daily_rollup_follows_order_changes(
+    create_user_from_factory,
+    create_order_passing_bev_menu_user_at_specific_date,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: partner establishment with a beverage and three orders made today
+    customer = create_user_from_factory('customer')
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    menu = dict_data['menu']
+    beverage = dict_data['beverages'][0]
+    today = timezone.now()
+    orders = [create_order_passing_bev_menu_user_at_specific_date(
+        beverage=beverage,
+        menu=menu,
+        user=customer,
+        order_date=today
+    ) for _ in range(3)]
+    rollup = OrderDailyRollup.objects.get(
+        establishment=dict_data['establishment'],
+        beverage=beverage,
+        day=timezone.localtime(today).date()
+    )
+    # then: all orders are counted
+    assert rollup.count == 3
+    assert rollup.revenue == beverage.price * 3
+    # when: an order is completed, another one is cancelled and the last one is soft deleted
+    orders[0].status = 'completed'
+    orders[0].save()
+    orders[1].status = 'cancelled'
+    orders[1].save()
+    Order.objects.get(id=orders[2].id).soft_delete()
+    # then: only the deleted order leaves the rollup, status changes including cancellation do not
+    rollup.refresh_from_db()
+    assert rollup.count == 2
+    assert rollup.revenue == beverage.price * 2
+
+
+@pytest.mark.django_db
+def test_order_revenue_uses_price_charged_at_creation(
+    create_user_from_factory,
+    create_order_passing_bev_menu_user_at_specific_date,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: an order of two beverages at the current price
+    customer = create_user_from_factory('customer')
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    beverage = dict_data['beverages'][0]
+    price = beverage.price
+    today = timezone.now()
+    order = OrderFactory.create(beverage=beverage, menu=dict_data['menu'], user=customer, order_date=today, quantity=2)
+    # when: the partner changes the price and another order is made
+    beverage.price = price + Decimal('10.00')
+    beverage.save()
+    create_order_passing_bev_menu_user_at_specific_date(
+        beverage=beverage,
+        menu=dict_data['menu'],
+        user=customer,
+        order_date=today
+    )
+    # then: each order keeps what it was charged and stats sum those amounts
+    order.refresh_from_db()
+    assert order.unit_price == price
+    assert order.line_total == price * 2
+    totals = Order.statistics.get_daily_totals(dict_data['partner'], today, today)
+    assert totals[timezone.localtime(today).date()] == {'count': 2, 'sum': price * 2 + beverage.price}
+
+
+@pytest.mark.django_db
+def test_backfill_order_rollups_command(
+    create_num_of_users_from_factory,
+    create_order_passing_bev_menu_user_at_specific_date,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: orders spread over several days and an emptied rollup table
+    customers = create_num_of_users_from_factory(3)
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(2)
+    menu = dict_data['menu']
+    beverages = dict_data['beverages']
+    today = timezone.now()
+    for i in range(10):
+        create_order_passing_bev_menu_user_at_specific_date(
+            beverage=choice(beverages),
+            menu=menu,
+            user=choice(customers),
+            order_date=today - timedelta(days=i % 4)
+        )
+    cancelled = Order.objects.first()
+    cancelled.status = 'cancelled'
+    cancelled.save()
+    expected = {(row.establishment_id, row.beverage_id, row.day): (row.count, row.revenue)
+                for row in OrderDailyRollup.objects.all()}
+    OrderDailyRollup.objects.all().delete()
+    # when: rollups are rebuilt from the orders table
+    call_command('backfill_order_rollups')
+    # then: the table matches what incremental updates produced
+    rebuilt = {(row.establishment_id, row.beverage_id, row.day): (row.count, row.revenue)
+               for row in OrderDailyRollup.objects.all()}
+    assert rebuilt == expected
+
+
+@pytest.mark.django_db
+def test_order_keeps_establishment_and_owner_of_its_beverage(
+    create_user_from_factory,
+    create_order_passing_bev_menu_user_at_specific_date,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: an order of a beverage in the partner's establishment
+    customer = create_user_from_factory('customer')
+    new_owner = create_user_from_factory('partner')
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    establishment = dict_data['establishment']
+    order = create_order_passing_bev_menu_user_at_specific_date(
+        beverage=dict_data['beverages'][0],
+        menu=dict_data['menu'],
+        user=customer,
+        order_date=timezone.now()
+    )
+    # then: the establishment and its owner are stored on the order
+    assert order.establishment_id == establishment.id
+    assert order.owner_id == dict_data['partner'].id
+    # when: the establishment changes hands
+    establishment.owner = new_owner
+    establishment.save()
+    # then: the order follows the new owner
+    order.refresh_from_db()
+    assert order.owner_id == new_owner.id
+    assert list(Order.statistics.for_partner(new_owner)) == [order]
+    # when: an order is created for the establishment without its owner
+    other = Order.objects.create(
+        user=customer, menu=dict_data['menu'], beverage=dict_data['beverages'][0], establishment=establishment
+    )
+    # then: the owner is filled in all the same
+    assert other.owner_id == new_owner.id
+
+
+@pytest.mark.django_db
+def test_stats_are_served_from_cache_until_partner_orders_change(
+    create_user_from_factory,
+    jwt_auth_api_client_pass_user,
+    create_order_passing_bev_menu_user_at_specific_date,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: auth partner with one order made today
+    customer = create_user_from_factory('customer')
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    partner = dict_data['partner']
+    menu = dict_data['menu']
+    beverage = dict_data['beverages'][0]
+    today = timezone.now()
+    create_order_passing_bev_menu_user_at_specific_date(beverage=beverage, menu=menu, user=customer, order_date=today)
+    client = jwt_auth_api_client_pass_user(partner)
+    url = reverse('partner-stats')
+    client.get(url)
+    # when: partner refreshes the stats page
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(url)
+    # then: only the user is fetched for jwt auth, stats come from cache
+    assert response.status_code == 200
+    assert len(ctx) == 1
+    assert response.data['this_week'][today.strftime('%a-%Y-%m-%d')]['count'] == 1
+    # when: a new order is made for the partner
+    create_order_passing_bev_menu_user_at_specific_date(beverage=beverage, menu=menu, user=customer, order_date=today)
+    response = client.get(url)
+    # then: cached stats are invalidated
+    assert response.data['this_week'][today.strftime('%a-%Y-%m-%d')]['count'] == 2
+    # when: the stats version is evicted from the cache and another order is made
+    cache.delete(get_stats_version_key(partner.id))
+    client.get(url)
+    create_order_passing_bev_menu_user_at_specific_date(beverage=beverage, menu=menu, user=customer, order_date=today)
+    cache.delete(get_stats_version_key(partner.id))
+    response = client.get(url)
+    # then: stats cached under earlier versions do not come back
+    assert response.data['this_week'][today.strftime('%a-%Y-%m-%d')]['count'] == 3
+
+
+@pytest.mark.django_db
+def test_get_stats_series_by_granularity_as_partner(
+    create_user_from_factory,
+    jwt_auth_api_client_pass_user,
+    create_order_passing_bev_menu_user_at_specific_date,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: auth partner with orders of two beverages over three days
+    customer = create_user_from_factory('customer')
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(2)
+    partner = dict_data['partner']
+    menu = dict_data['menu']
+    bev1, bev2 = dict_data['beverages']
+    today = timezone.localtime(timezone.now()).replace(hour=12, minute=0, second=0, microsecond=0)
+    for days_ago, beverage in [(0, bev1), (0, bev2), (2, bev1)]:
+        create_order_passing_bev_menu_user_at_specific_date(
+            beverage=beverage,
+            menu=menu,
+            user=customer,
+            order_date=today - timedelta(days=days_ago)
+        )
+    client = jwt_auth_api_client_pass_user(partner)
+    url = reverse('partner-stats-series')
+    start = (today - timedelta(days=2)).date()
+    # when: partner requests a daily series
+    response = client.get(url, {'start': start.isoformat(), 'end': today.date().isoformat(), 'granularity': 'day'})
+    # then: every day of the range is present, including the empty one
+    assert response.status_code == 200
+    assert [bucket['count'] for bucket in response.data['series']] == [1, 0, 2]
+    assert Decimal(response.data['series'][2]['sum']) == bev1.price + bev2.price
+    # when: partner requests an hourly series of a single beverage
+    response = client.get(url, {
+        'start': today.date().isoformat(),
+        'end': today.date().isoformat(),
+        'granularity': 'hour',
+        'beverage_id': bev2.id
+    })
+    # then: only the hour of that beverage's order is counted
+    assert response.status_code == 200
+    assert len(response.data['series']) == 24
+    assert [bucket['count'] for bucket in response.data['series']][12] == 1
+    assert sum(bucket['count'] for bucket in response.data['series']) == 1
+
+
+@pytest.mark.django_db
+def test_get_stats_series_with_too_many_buckets_as_partner(jwt_auth_api_client):
+    # given: auth partner
+    client = jwt_auth_api_client(role='partner')
+    # when: partner requests hourly stats for a whole year
+    url = reverse('partner-stats-series')
+    response = client.get(url, {'start': '2023-01-01', 'end': '2023-12-31', 'granularity': 'hour'})
+    # then: request is rejected before touching orders
+    assert response.status_code == 400
+    assert 'error' in response.data
+
+
+@pytest.mark.django_db
+def test_export_partners_orders_as_csv_and_ndjson(
+    create_order_for_specific_beverage_from_factory,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict,
+    jwt_auth_api_client_pass_user
+):
+    # given: authenticated partner with orders for their beverages and an order elsewhere
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(3)
+    partner = dict_data['partner']
+    orders = [create_order_for_specific_beverage_from_factory(beverage) for beverage in dict_data['beverages']]
+    orders.append(create_order_for_specific_beverage_from_factory(dict_data['beverages'][0]))
+    other_order = OrderFactory.create()
+    client = jwt_auth_api_client_pass_user(partner)
+    url = reverse('partners-order-export')
+    # when: partner exports orders as csv
+    response = client.get(url)
+    # then: every order of the partner is streamed after the header row
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'text/csv'
+    assert not response.is_async
+    lines = b''.join(response).decode().splitlines()
+    assert lines[0].startswith('id,user_email')
+    assert len(lines) == len(orders) + 1
+    # when: partner exports orders through ASGI
+    token = RefreshToken.for_user(partner).access_token
+
+    async def export():
+        response = await AsyncClient().get(url, headers={'Authorization': f'Bearer {token}'})
+        return response, b''.join([chunk async for chunk in response.streaming_content])
+
+    response, content = async_to_sync(export)()
+    # then: the same rows are streamed through an asynchronous iterator
+    assert response.is_async
+    assert content.decode().splitlines() == lines
+    # when: partner exports only one status as ndjson
+    response = client.get(url, {'export_format': 'ndjson', 'status': orders[0].status})
+    # then: rows are json objects of matching orders only
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in b''.join(response).decode().splitlines()]
+    assert rows
+    assert all(row['status'] == orders[0].status for row in rows)
+    assert other_order.id not in [row['id'] for row in rows]
+
+
+@pytest.mark.django_db
+def test_get_orders_list_of_customer_with_cursor_pagination(
+    create_user_from_factory,
+    jwt_auth_api_client_pass_user,
+    create_num_of_orders_for_one_user_from_factory
+):
+    # given: auth customer with orders, some of them made at the same moment
+    customer = create_user_from_factory('customer')
+    client = jwt_auth_api_client_pass_user(customer)
+    orders = create_num_of_orders_for_one_user_from_factory(customer, 12)
+    Order.objects.filter(id__in=[order.id for order in orders[:4]]).update(order_date=orders[0].order_date)
+    expected_ids = list(Order.objects.filter(user=customer).order_by('-order_date', '-id').values_list('id', flat=True))
+    url = reverse('customers-order-list-create')
+    # when: customer scrolls through the history with cursors
+    response = client.get(url, {'pagination': 'cursor', 'limit': 5})
+    assert response.status_code == 200
+    assert response.data['previous'] is None
+    seen_ids = [item['id'] for item in response.data['results']]
+    # and: a new order is made while scrolling
+    OrderFactory.create(user=customer, order_date=timezone.now() + timedelta(days=1))
+    next_url = response.data['next']
+    while next_url:
+        response = client.get(next_url)
+        assert response.status_code == 200
+        seen_ids += [item['id'] for item in response.data['results']]
+        next_url = response.data['next']
+    # then: every order is seen exactly once and in order
+    assert seen_ids == expected_ids
+    # when: customer goes one page back
+    response = client.get(response.data['previous'])
+    # then: the previous page is returned in the same order
+    assert [item['id'] for item in response.data['results']] == expected_ids[5:10]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_happy_hour_claims_as_customer(
+    create_user_from_factory,
+    jwt_auth_api_client_pass_user,
+    create_beverage_from_factory,
+    create_user_subscription
+):
+    # given: subscribed customer and a beverage during happy hours
+    customer = create_user_from_factory('customer')
+    create_user_subscription(customer)
+    beverage = create_beverage_from_factory
+    establishment = beverage.menu.establishment
+    establishment.happy_hour_start = (timezone.localtime(timezone.now()) - timezone.timedelta(minutes=1)).time()
+    establishment.happy_hour_end = (timezone.localtime(timezone.now()) + timezone.timedelta(hours=1)).time()
+    establishment.save()
+    url = reverse('customers-order-list-create')
+    parallel_requests = 5
+    barrier = threading.Barrier(parallel_requests)
+    status_codes = []
+
+    def claim():
+        client = jwt_auth_api_client_pass_user(customer)
+        try:
+            barrier.wait()
+            response = client.post(url, data=json.dumps({'beverage_id': beverage.id}), content_type='application/json')
+            status_codes.append(response.status_code)
+        finally:
+            connection.close()
+
+    # when: customer fires several claims at the same moment
+    threads = [threading.Thread(target=claim) for _ in range(parallel_requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # then: exactly one free beverage is given out
+    assert sorted(status_codes) == [201] + [400] * (parallel_requests - 1)
+    assert Order.objects.filter(user=customer).count() == 1
+    assert HappyHourClaim.objects.filter(user=customer, establishment=establishment).count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_partner_order_events_stream(
+    create_user_from_factory,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: partner with an open event stream
+    customer = create_user_from_factory('customer')
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    token = RefreshToken.for_user(dict_data['partner']).access_token
+    url = reverse('partners-order-events')
+
+    def create_order():
+        try:
+            return OrderFactory.create(beverage=dict_data['beverages'][0], menu=dict_data['menu'], user=customer)
+        finally:
+            connection.close()
+
+    async def read_event(stream):
+        chunk = await asyncio.wait_for(anext(stream), timeout=5)
+        return dict(line.split(': ', 1) for line in chunk.decode().strip().split('\n'))
+
+    async def listen():
+        client = AsyncClient()
+        response = await client.get(url, headers={'Authorization': f'Bearer {token}'})
+        stream = aiter(response.streaming_content)
+        retry = await read_event(stream)
+        # when: an order is made while the stream is open
+        order = await sync_to_async(create_order)()
+        pushed = await read_event(stream)
+        await stream.aclose()
+        # when: another order is made while disconnected and the stream is resumed
+        missed = await sync_to_async(create_order)()
+        response = await client.get(url, headers={'Authorization': f'Bearer {token}', 'Last-Event-ID': pushed['id']})
+        stream = aiter(response.streaming_content)
+        await read_event(stream)
+        resumed = [await read_event(stream), await read_event(stream)]
+        await stream.aclose()
+        await sync_to_async(lambda: connection.close())()
+        return retry, order, pushed, missed, resumed
+
+    retry, order, pushed, missed, resumed = asyncio.run(listen())
+    # then: new orders are pushed right away, on resume the recent ones are replayed along with the missed ones
+    assert 'retry' in retry
+    assert pushed['event'] == 'order'
+    assert json.loads(pushed['data'])['id'] == order.id
+    assert [json.loads(event['data'])['id'] for event in resumed] == [order.id, missed.id]
+    assert resumed[0]['id'] == pushed['id']
+    assert not order_events.subscriptions
+
+
+@pytest.mark.django_db
+def test_partner_order_events_pick_up_late_commits(
+    create_order_for_specific_beverage_from_factory,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: a stream positioned after the partner's latest order
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    partner, beverage = dict_data['partner'], dict_data['beverages'][0]
+    seen = create_order_for_specific_beverage_from_factory(beverage)
+    view = PartnersOrderEventsView()
+    position, sent = view.get_latest_position(partner)
+    # when: an order saved earlier only becomes visible now
+    late = create_order_for_specific_beverage_from_factory(beverage)
+    Order.objects.filter(id=late.id).update(last_updated=position[0] - timedelta(seconds=1))
+    events, new_position = view.get_events(partner, position, sent)
+    # then: it is pushed once without moving the position back
+    assert [json.loads(event.split('data: ', 1)[1])['id'] for event in events] == [late.id]
+    assert new_position == position
+    assert view.get_events(partner, position, sent) == ([], position)
+    assert seen.id in {order_id for order_id, _ in sent}
+
+
+@pytest.mark.django_db
+def test_partner_order_events_stream_as_customer(jwt_auth_api_client):
+    # given: authenticated customer
+    client = jwt_auth_api_client(role='customer')
+    # when:
+    response = client.get(reverse('partners-order-events'))
+    # then:
+    assert response.status_code == 403
+
+
+@pytest.mark.django_db
+def test_orders_reserve_and_release_beverage_stock(
+    create_user_from_factory,
+    jwt_auth_api_client_pass_user,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: partner with a beverage of which one is left in stock
+    customer = create_user_from_factory('customer')
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    beverage = dict_data['beverages'][0]
+    beverage.in_stock = 1
+    beverage.save()
+    client = jwt_auth_api_client_pass_user(dict_data['partner'])
+    data = json.dumps({'beverage_id': beverage.id, 'customer_id': customer.id})
+    # when: two orders are made
+    created = client.post(reverse('partners-order-create'), data=data, content_type='application/json')
+    rejected = client.post(reverse('partners-order-create'), data=data, content_type='application/json')
+    # then: the second one finds the beverage out of stock
+    assert created.status_code == 201
+    assert rejected.status_code == 400
+    beverage.refresh_from_db()
+    assert beverage.in_stock == 0
+    # when: the first order is cancelled
+    response = client.patch(
+        reverse('partners-order-detail', args=[created.json()['id']]),
+        data=json.dumps({'status': 'cancelled'}),
+        content_type='application/json'
+    )
+    # then: its beverage is back in stock and the order can not be reopened
+    assert response.status_code == 200
+    beverage.refresh_from_db()
+    assert beverage.in_stock == 1
+    response = client.patch(
+        reverse('partners-order-detail', args=[created.json()['id']]),
+        data=json.dumps({'status': 'pending'}),
+        content_type='application/json'
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_orders_do_not_oversell_beverage_stock(
+    create_num_of_users_from_factory,
+    jwt_auth_api_client_pass_user,
+    create_partner_establishment_menu_and_num_of_beverages_as_dict
+):
+    # given: a beverage with three left in stock and more customers than that
+    parallel_requests = 8
+    in_stock = 3
+    customers = create_num_of_users_from_factory(parallel_requests)
+    dict_data = create_partner_establishment_menu_and_num_of_beverages_as_dict(1)
+    beverage = dict_data['beverages'][0]
+    beverage.in_stock = in_stock
+    beverage.save()
+    url = reverse('partners-order-create')
+    barrier = threading.Barrier(parallel_requests)
+    status_codes = []
+
+    def order(customer):
+        client = jwt_auth_api_client_pass_user(dict_data['partner'])
+        data = json.dumps({'beverage_id': beverage.id, 'customer_id': customer.id})
+        try:
+            barrier.wait()
+            status_codes.append(client.post(url, data=data, content_type='application/json').status_code)
+        finally:
+            connection.close()
+
+    # when: every customer orders at the same moment
+    threads = [threading.Thread(target=order, args=(customer,)) for customer in customers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # then: exactly the stock is sold
+    assert sorted(status_codes) == [201] * in_stock + [400] * (parallel_requests - in_stock)
+    beverage.refresh_from_db()
+    assert beverage.in_stock == 0
+    assert Order.objects.filter(beverage=beverage).count() == in_stock